@@ -1,21 +1,131 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, abort, g, stream_with_context
+from flask.cli import pass_script_info
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, case, insert, inspect, text, bindparam, select, tuple_, union
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateIndex
 from werkzeug.security import generate_password_hash, check_password_hash
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import io
-import base64
+from werkzeug.utils import secure_filename
+import hmac
+import math
 import os
-from datetime import datetime, date
-import seaborn as sns
-from functools import wraps
+import sys
+from datetime import datetime, date, timedelta
+from functools import lru_cache, wraps
+import click
+import random
+import time
+import weakref
+from dbconfig import configure_engine, database_url, engine_options, run_concurrency_check
+from gradebook import GradebookError, iter_gradebook_rows, parse_mark_row
+from exports import MIMETYPES as EXPORT_MIMETYPES, iter_export
+from stats import MarkArrays, mark_statistics
+from grading import DEFAULT_BANDS, DEFAULT_SCALE, GradeScale, GradeScaleCache, GradeScaleError, GradeScales, grade_marks, parse_bands
+from pagecache import PageCache
+from attendance_bits import TermAttendance, build_terms, term_start
+from charts import ChartCache, preload_plotting, render_class_chart, render_student_chart, render_in_pool, stress_test
+from profiling import QueryProfiler
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, benchmark_overhead
+from benchmarks import (benchmark_statistics, compare_to_baseline, load_baseline, measure_startup, run_benchmarks,
+                        synthetic_marks, write_baseline)
+from loadtest import LocalServer, count_lock_errors, run_load
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///school.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
-db = SQLAlchemy(app)
+db = SQLAlchemy()
+profiler = QueryProfiler()
+chart_cache = ChartCache()
+grade_scale_cache = GradeScaleCache()
+page_cache = PageCache()
+bp = Blueprint('main', __name__, cli_group=None)
+
+# ==================== METRICS ====================
+
+metrics = MetricsRegistry()
+chart_render_seconds = metrics.histogram(
+    'chart_render_seconds', 'Time to render a chart PNG on a cache miss.', ('chart',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+metrics.callback('chart_cache_hits_total', 'Charts served from the cache.', lambda: chart_cache.hits, 'counter')
+metrics.callback('chart_cache_misses_total', 'Charts that had to be rendered.', lambda: chart_cache.misses, 'counter')
+metrics.callback('chart_cache_memory_entries', 'Charts held in the in-memory cache tier.', lambda: len(chart_cache))
+metrics.callback('page_cache_hits_total', 'Student pages served from the rendered page cache.', lambda: page_cache.hits, 'counter')
+metrics.callback('page_cache_misses_total', 'Student pages that had to be rendered.', lambda: page_cache.misses, 'counter')
+pages_not_modified = metrics.counter('pages_not_modified_total', 'Page requests answered 304 Not Modified, by endpoint.', ('endpoint',))
+db_pool_checkouts = metrics.counter('db_pool_checkouts_total', 'Connections checked out of the DB pool.')
+rows_written = metrics.counter('rows_written_total', 'Mark and attendance rows written, by route.', ('source',))
+
+def _pool_checked_out():
+    checkedout = getattr(db.engine.pool, 'checkedout', None)
+    return checkedout() if checkedout else None
+
+metrics.callback('db_pool_checked_out', 'Connections currently checked out of the DB pool.', _pool_checked_out)
+
+# ==================== APPLICATION FACTORY ====================
+
+# Engines of every live app; weak, so an app that is dropped (tests,
+# factories called per worker) doesn't stay alive through the fork hook
+_engines = weakref.WeakSet()
+
+def _dispose_engines_after_fork():
+    # A forked worker must not reuse connections opened by the parent
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+def create_app(config=None):
+    """Build the application.
+
+    ``config`` is applied over the defaults, e.g. a different database URL.
+    Plotting libraries aren't imported here but on the first chart render,
+    unless ``PRELOAD_PLOTTING`` is set so that a pre-forking server
+    (``gunicorn --preload``) loads them once and shares them with every
+    worker.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
+    app.config['CHART_CACHE_DIR'] = os.path.join(app.instance_path, 'chart_cache')
+    app.config['CHART_CACHE_SIZE'] = 64
+    app.config['CHART_RENDER_WORKERS'] = 2  # 0 renders in the request thread
+    app.config['CHART_DPI'] = 150
+    app.config['IMPORT_BATCH_SIZE'] = 1000
+    app.config['IMPORT_MAX_REPORTED_ERRORS'] = 20
+    app.config['EXPORT_BATCH_SIZE'] = 1000  # rows fetched per round trip while streaming an export
+    app.config['SQL_PROFILING'] = os.environ.get('SQL_PROFILING', '').lower() in ('1', 'true', 'yes')
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # bearer token scrapers send to /metrics
+    # Serve /metrics to anyone, for scrapers on a trusted network without a token
+    app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', '').lower() in ('1', 'true', 'yes')
+    app.config['PRELOAD_PLOTTING'] = os.environ.get('PRELOAD_PLOTTING', '').lower() in ('1', 'true', 'yes')
+    app.config['GRADE_SCALE_CACHE_SECONDS'] = float(os.environ.get('GRADE_SCALE_CACHE_SECONDS', 60))
+    app.config['STUDENT_SEARCH_LIMIT'] = int(os.environ.get('STUDENT_SEARCH_LIMIT', 20))  # most students one enrollment search returns
+    app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', 256))  # rendered student pages; 0 disables
+    if os.environ.get('PAGE_CACHE_REVISION'):
+        app.config['PAGE_CACHE_REVISION'] = os.environ['PAGE_CACHE_REVISION']  # e.g. the deployed commit
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    db.init_app(app)
+    app.register_blueprint(bp)
+    chart_cache.init_app(app)
+    grade_scale_cache.init_app(app)
+    page_cache.init_app(app)
+    app.config.setdefault('PAGE_CACHE_REVISION', _code_revision(app))
+    with app.app_context():
+        engine = db.engine
+        configure_engine(engine)
+        _engines.add(engine)
+        event.listen(engine.pool, 'checkout', lambda *args: db_pool_checkouts.inc())
+        if app.config['SQL_PROFILING']:
+            profiler.init_app(app, engine)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
+    if app.config['PRELOAD_PLOTTING']:
+        preload_plotting()
+    return app
 
 # ==================== DATABASE MODELS ====================
 
@@ -23,10 +133,18 @@ db = SQLAlchemy(app)
 class_students = db.Table('class_students',
     db.Column('class_id', db.Integer, db.ForeignKey('class.id'), primary_key=True),
     db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key=True),
-    db.Column('enrolled_at', db.DateTime, default=datetime.utcnow)
+    db.Column('enrolled_at', db.DateTime, default=datetime.utcnow),
+    # The primary key covers class -> students; this covers student -> classes
+    db.Index('ix_class_students_student', 'student_id', 'class_id')
 )
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+        # Case-insensitive prefix search for the enrollment typeahead
+        db.Index('ix_user_username_lower', text('lower(username)')),
+        db.Index('ix_user_email_lower', text('lower(email)')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -39,6 +157,9 @@ class User(db.Model):
     teacher_profile = db.relationship('Teacher', backref='user', uselist=False, cascade='all, delete-orphan')
 
 class Student(db.Model):
+    __table_args__ = (
+        db.Index('ix_student_roll_number_lower', text('lower(roll_number)')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     roll_number = db.Column(db.String(50), unique=True)
@@ -48,27 +169,16 @@ class Student(db.Model):
     classes = db.relationship('Class', secondary=class_students, backref='students')
     marks = db.relationship('Mark', backref='student', cascade='all, delete-orphan')
     attendance = db.relationship('Attendance', backref='student', cascade='all, delete-orphan')
+    class_stats = db.relationship('StudentClassStats', backref='student', cascade='all, delete-orphan')
+    attendance_bitmaps = db.relationship('AttendanceBitmap', backref='student', cascade='all, delete-orphan')
     
     def get_average_marks(self, class_id=None):
         """Calculate average marks for all subjects or specific class"""
-        if class_id:
-            marks = Mark.query.filter_by(student_id=self.id, class_id=class_id).all()
-        else:
-            marks = self.marks
-        if not marks:
-            return 0
-        return sum(mark.marks for mark in marks) / len(marks)
+        return get_mark_stats(student_id=self.id, class_id=class_id or None)['average']
     
     def get_attendance_percentage(self, class_id=None):
         """Calculate attendance percentage"""
-        if class_id:
-            attendance = Attendance.query.filter_by(student_id=self.id, class_id=class_id).all()
-        else:
-            attendance = self.attendance
-        if not attendance:
-            return 0
-        present = sum(1 for a in attendance if a.status == 'present')
-        return (present / len(attendance)) * 100
+        return get_attendance_stats(student_id=self.id, class_id=class_id or None)['percentage']
 
 class Teacher(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -84,6 +194,7 @@ class Subject(db.Model):
     name = db.Column(db.String(100), nullable=False, unique=True)
     code = db.Column(db.String(20), unique=True)
     description = db.Column(db.Text)
+    grading_scale_id = db.Column(db.Integer, db.ForeignKey('grading_scale.id'))  # None uses the default scale
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -97,6 +208,8 @@ class Class(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
     academic_year = db.Column(db.String(20))
+    # Bumped by writes that change what every student in the class sees
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -104,21 +217,23 @@ class Class(db.Model):
     attendance = db.relationship('Attendance', backref='class_ref', cascade='all, delete-orphan')
     announcements = db.relationship('Announcement', backref='class_ref', cascade='all, delete-orphan')
     assignments = db.relationship('Assignment', backref='class_ref', cascade='all, delete-orphan')
+    student_stats = db.relationship('StudentClassStats', backref='class_ref', cascade='all, delete-orphan')
+    attendance_bitmaps = db.relationship('AttendanceBitmap', backref='class_ref', cascade='all, delete-orphan')
     
     def get_class_average(self):
         """Calculate average marks for the entire class"""
-        if not self.marks:
-            return 0
-        return sum(mark.marks for mark in self.marks) / len(self.marks)
+        return get_mark_stats(class_id=self.id)['average']
     
     def get_class_attendance_percentage(self):
         """Calculate overall class attendance percentage"""
-        if not self.attendance:
-            return 0
-        present = sum(1 for a in self.attendance if a.status == 'present')
-        return (present / len(self.attendance)) * 100
+        return get_attendance_stats(class_id=self.id)['percentage']
 
 class Mark(db.Model):
+    __table_args__ = (
+        db.Index('ix_mark_student_class_date', 'student_id', 'class_id', 'exam_date'),
+        db.Index('ix_mark_class_date', 'class_id', 'exam_date'),
+        db.Index('ix_mark_class_type_date', 'class_id', 'exam_type', 'exam_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
@@ -134,14 +249,13 @@ class Mark(db.Model):
         return (self.marks / self.max_marks) * 100
     
     def get_grade(self):
-        percentage = self.get_percentage()
-        if percentage >= 90: return 'A'
-        elif percentage >= 80: return 'B'
-        elif percentage >= 70: return 'C'
-        elif percentage >= 60: return 'D'
-        else: return 'F'
+        return grade_scales().for_subject(self.subject_id).grade(self.get_percentage())
 
 class Attendance(db.Model):
+    __table_args__ = (
+        db.Index('uq_attendance_student_class_date', 'student_id', 'class_id', 'date', unique=True),
+        db.Index('ix_attendance_class_date', 'class_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
@@ -150,6 +264,79 @@ class Attendance(db.Model):
     remarks = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class AttendanceBitmap(db.Model):
+    """Bit-packed attendance of one student in one class over one term.
+
+    Derived from Attendance and kept in step by save_attendance(); the
+    calendar and streaks are read from here in a single row lookup.
+    """
+    __tablename__ = 'attendance_bitmap'
+    __table_args__ = (
+        db.Index('ix_attendance_bitmap_class', 'class_id', 'term_start'),
+    )
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    term_start = db.Column(db.Date, primary_key=True)
+    present = db.Column(db.LargeBinary, nullable=False)
+    late = db.Column(db.LargeBinary, nullable=False)
+    absent = db.Column(db.LargeBinary, nullable=False)
+    
+    def to_term(self):
+        return TermAttendance.from_bytes(self.term_start, self.present, self.late, self.absent)
+    
+    def update_from(self, term):
+        for status, bits in term.to_bytes().items():
+            setattr(self, status, bits)
+
+class StudentClassStats(db.Model):
+    """Running mark and attendance totals for one student in one class"""
+    __tablename__ = 'student_class_stats'
+    __table_args__ = (
+        db.Index('ix_student_class_stats_class', 'class_id'),
+    )
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    mark_count = db.Column(db.Integer, nullable=False, default=0)
+    mark_sum = db.Column(db.Float, nullable=False, default=0)
+    percentage_sum = db.Column(db.Float, nullable=False, default=0)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    late_count = db.Column(db.Integer, nullable=False, default=0)
+    absent_count = db.Column(db.Integer, nullable=False, default=0)
+    last_exam_date = db.Column(db.Date)
+    # Bumped with every change to the row, i.e. every mark or attendance write for the student
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class GradingScale(db.Model):
+    """A named set of letter grades; the default one applies to every subject without its own"""
+    __tablename__ = 'grading_scale'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    is_default = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    bands = db.relationship('GradeBand', backref='scale', cascade='all, delete-orphan',
+                            order_by='GradeBand.min_percentage.desc()')
+    subjects = db.relationship('Subject', backref='grading_scale')
+    
+    def to_scale(self):
+        return GradeScale((band.letter, band.min_percentage) for band in self.bands)
+
+class GradeBand(db.Model):
+    """One letter of a grading scale and the lowest percentage that earns it"""
+    __tablename__ = 'grade_band'
+    id = db.Column(db.Integer, primary_key=True)
+    scale_id = db.Column(db.Integer, db.ForeignKey('grading_scale.id'), nullable=False)
+    letter = db.Column(db.String(5), nullable=False)
+    min_percentage = db.Column(db.Float, nullable=False)
+
+class SchemaMigration(db.Model):
+    """A migration from MIGRATIONS that has been applied to this database"""
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
@@ -166,30 +353,1341 @@ class Assignment(db.Model):
     max_marks = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# ==================== GRADE SCALES ====================
+
+def load_grade_scales():
+    """Read the default grading scale and every subject's override from the database"""
+    rows = GradingScale.query.options(selectinload(GradingScale.bands)).all()
+    scales = {row.id: row.to_scale() for row in rows if len(row.bands) >= 2}
+    default = next((scales[row.id] for row in rows if row.is_default and row.id in scales), DEFAULT_SCALE)
+    assigned = db.session.query(Subject.id, Subject.grading_scale_id).filter(Subject.grading_scale_id.isnot(None))
+    return GradeScales(default, {subject_id: scales[scale_id] for subject_id, scale_id in assigned if scale_id in scales})
+
+def grade_scales():
+    """The current GradeScales, from the in-process cache"""
+    return grade_scale_cache.get(load_grade_scales)
+
+def class_grade_scale(class_id):
+    """The scale a class's marks are graded on, i.e. its subject's"""
+    class_obj = db.session.get(Class, class_id)
+    return grade_scales().for_subject(class_obj.subject_id if class_obj else None)
+
+def graded_marks(marks):
+    """``(mark, percentage, grade)`` for a list of Marks, graded in one vectorized pass"""
+    return grade_marks(grade_scales(), marks)
+
+
+# ==================== AGGREGATE QUERIES ====================
+
+ROLLUP_COUNTERS = ('mark_count', 'mark_sum', 'percentage_sum', 'present_count', 'late_count', 'absent_count')
+ATTENDANCE_COUNTERS = {'present': 'present_count', 'late': 'late_count', 'absent': 'absent_count'}
+
+def _mark_stats_row(count, mark_sum, percentage_sum):
+    count = count or 0
+    return {
+        'count': count,
+        'average': (mark_sum or 0) / count if count else 0,
+        'average_percentage': (percentage_sum or 0) / count if count else 0
+    }
+
+def _attendance_stats_row(present, late, absent):
+    present = present or 0
+    late = late or 0
+    absent = absent or 0
+    total = present + late + absent
+    return {
+        'total': total,
+        'present': present,
+        'late': late,
+        'absent': absent,
+        'percentage': (present / total) * 100 if total else 0
+    }
+
+def _rollup_query(*columns, student_id=None, class_id=None):
+    query = db.session.query(*columns)
+    if student_id is not None:
+        query = query.filter(StudentClassStats.student_id == student_id)
+    if class_id is not None:
+        query = query.filter(StudentClassStats.class_id == class_id)
+    return query
+
+def get_mark_stats(student_id=None, class_id=None):
+    """Count and average marks from the per-(student, class) rollup"""
+    return _mark_stats_row(*_rollup_query(
+        func.sum(StudentClassStats.mark_count),
+        func.sum(StudentClassStats.mark_sum),
+        func.sum(StudentClassStats.percentage_sum),
+        student_id=student_id, class_id=class_id
+    ).one())
+
+def get_attendance_stats(student_id=None, class_id=None):
+    """Count attendance by status from the per-(student, class) rollup"""
+    return _attendance_stats_row(*_rollup_query(
+        func.sum(StudentClassStats.present_count),
+        func.sum(StudentClassStats.late_count),
+        func.sum(StudentClassStats.absent_count),
+        student_id=student_id, class_id=class_id
+    ).one())
+
+def get_class_mark_stats_by_student(class_id):
+    """Mark stats for every student in a class, keyed by student id.
+
+    Students without a rollup row are not included in the result.
+    """
+    rows = StudentClassStats.query.filter_by(class_id=class_id).all()
+    return {row.student_id: _mark_stats_row(row.mark_count, row.mark_sum, row.percentage_sum) for row in rows}
+
+def get_class_attendance_stats_by_student(class_id):
+    """Attendance stats for every student in a class, keyed by student id.
+
+    Students without a rollup row are not included in the result.
+    """
+    rows = StudentClassStats.query.filter_by(class_id=class_id).all()
+    return {row.student_id: _attendance_stats_row(row.present_count, row.late_count, row.absent_count) for row in rows}
+
+def mark_percentage():
+    """SQL expression matching Mark.get_percentage()"""
+    return (Mark.marks / Mark.max_marks) * 100
+
+def mark_grade(scale=None):
+    """SQL CASE expression matching Mark.get_grade().
+
+    With a ``scale`` every mark is graded on it; otherwise each mark is
+    graded on its own subject's scale.
+    """
+    if scale is not None:
+        return scale.sql(mark_percentage())
+    return grade_scales().sql(mark_percentage(), Mark.subject_id)
+
+def load_mark_arrays(class_id=None, subject_id=None, teacher_id=None):
+    """A class's or a whole subject's marks as MarkArrays, from one columnar query.
+
+    Subject marks are selected through the subject's classes so the query
+    can use the class index; ``teacher_id`` keeps only that teacher's classes.
+    """
+    query = select(Mark.student_id, func.coalesce(Mark.exam_type, ''), mark_percentage()) \
+        .where(Mark.max_marks > 0)
+    if class_id is not None:
+        query = query.where(Mark.class_id == class_id)
+    if subject_id is not None:
+        classes = select(Class.id).where(Class.subject_id == subject_id)
+        if teacher_id is not None:
+            classes = classes.where(Class.teacher_id == teacher_id)
+        query = query.where(Mark.class_id.in_(classes))
+    return MarkArrays.from_rows(db.session.execute(query).all())
+
+def get_grade_distribution(student_id=None, class_id=None):
+    """Count marks per letter grade with one GROUP BY query.
+
+    A class's marks are graded on its subject's scale, and the result
+    lists every letter of that scale; a student's are graded per subject.
+    """
+    scale = class_grade_scale(class_id) if class_id is not None else None
+    grade = mark_grade(scale)
+    query = db.session.query(grade, func.count(Mark.id))
+    if student_id is not None:
+        query = query.filter(Mark.student_id == student_id)
+    if class_id is not None:
+        query = query.filter(Mark.class_id == class_id)
+    distribution = dict.fromkeys((scale or grade_scales().default).letters, 0)
+    distribution.update(query.group_by(grade).all())
+    return distribution
+
+def get_class_student_stats(class_id):
+    """Mark and attendance stats for every enrolled student, in one pass.
+
+    A single query joins the enrollment table to the rollup, so the cost is
+    one row per student regardless of how many marks the class has.
+    Rows are ordered by username.
+    """
+    rows = db.session.query(
+        Student.id, User.username, Student.roll_number,
+        StudentClassStats.mark_count, StudentClassStats.mark_sum, StudentClassStats.percentage_sum,
+        StudentClassStats.present_count, StudentClassStats.late_count, StudentClassStats.absent_count
+    ).select_from(class_students) \
+        .join(Student, Student.id == class_students.c.student_id) \
+        .join(User, User.id == Student.user_id) \
+        .outerjoin(StudentClassStats, (StudentClassStats.student_id == Student.id) &
+                   (StudentClassStats.class_id == class_students.c.class_id)) \
+        .filter(class_students.c.class_id == class_id) \
+        .order_by(User.username).all()
+    student_stats = []
+    for student_id, username, roll_number, count, mark_sum, percentage_sum, present, late, absent in rows:
+        marks = _mark_stats_row(count, mark_sum, percentage_sum)
+        attendance = _attendance_stats_row(present, late, absent)
+        student_stats.append({
+            'id': student_id,
+            'username': username,
+            'roll_number': roll_number,
+            'exams': marks['count'],
+            'average': marks['average'],
+            'average_percentage': marks['average_percentage'],
+            'attendance_percentage': attendance['percentage'],
+            'attendance_count': attendance['total']
+        })
+    return student_stats
+
+def _add_z_scores(student_stats, statistics):
+    """Copy each student's z-score from mark_statistics() onto their stats row"""
+    for row in student_stats:
+        student = statistics['students'].get(row['id'])
+        row['z_score'] = student['z_score'] if student else None
+
+# Backrefs such as Class.subject only exist once the mappers are configured,
+# which would otherwise wait for the first query
+configure_mappers()
+
+# Loader options for pages that list a class's roster
+CLASS_ROSTER = (joinedload(Class.subject), selectinload(Class.students).joinedload(Student.user))
+
+def get_enrollment_counts(class_ids):
+    """Number of enrolled students per class, as ``{class_id: count}``"""
+    if not class_ids:
+        return {}
+    return dict(db.session.query(class_students.c.class_id, func.count())
+                .filter(class_students.c.class_id.in_(class_ids))
+                .group_by(class_students.c.class_id).all())
+
+def get_student_class_counts(student_id):
+    """A student's exam and attendance-day counts per class, from the rollup"""
+    rows = db.session.query(
+        StudentClassStats.class_id, StudentClassStats.mark_count,
+        StudentClassStats.present_count + StudentClassStats.late_count + StudentClassStats.absent_count
+    ).filter(StudentClassStats.student_id == student_id).all()
+    return {class_id: {'exams': exams, 'days': days} for class_id, exams, days in rows}
+
+def get_percentage_series(student_id):
+    """A student's marks as a time-ordered list of percentages"""
+    rows = db.session.query(
+        Mark.exam_date, Mark.created_at, mark_percentage(), Mark.class_id, Mark.exam_type
+    ).filter(Mark.student_id == student_id) \
+        .order_by(func.coalesce(Mark.exam_date, func.date(Mark.created_at)), Mark.id).all()
+    return [{
+        'date': exam_date or created_at.date(),
+        'percentage': percentage,
+        'class_id': class_id,
+        'exam_type': exam_type
+    } for exam_date, created_at, percentage, class_id, exam_type in rows]
+
+# ==================== ROLLUP MAINTENANCE ====================
+
+def _bump_rollups(class_id, deltas_by_student):
+    """Add per-student deltas to a class's rollup rows in SQL.
+
+    ``deltas_by_student`` maps student id to counter deltas plus an optional
+    ``exam_date``. Existing rows are updated with one executemany UPDATE and
+    missing rows are inserted, so the cost does not grow with round trips.
+    """
+    if not deltas_by_student:
+        return
+    class_id = int(class_id)
+    deltas_by_student = {int(student_id): deltas for student_id, deltas in deltas_by_student.items()}
+    table = StudentClassStats.__table__
+    existing = {student_id for (student_id,) in db.session.query(StudentClassStats.student_id).filter(
+        StudentClassStats.class_id == class_id,
+        StudentClassStats.student_id.in_(deltas_by_student)
+    )}
+
+    if existing:
+        last = table.c.last_exam_date
+        new_date = bindparam('new_exam_date', type_=db.Date)
+        stmt = table.update().where(
+            (table.c.student_id == bindparam('row_student_id')) & (table.c.class_id == class_id)
+        ).values({
+            **{name: table.c[name] + bindparam(f'delta_{name}') for name in ROLLUP_COUNTERS},
+            'version': table.c.version + 1,
+            'last_exam_date': case((new_date.is_(None), last), (last.is_(None) | (last < new_date), new_date), else_=last)
+        })
+        db.session.execute(stmt, [{
+            'row_student_id': student_id,
+            'new_exam_date': deltas_by_student[student_id].get('exam_date'),
+            **{f'delta_{name}': deltas_by_student[student_id].get(name, 0) for name in ROLLUP_COUNTERS}
+        } for student_id in existing])
+
+    new_rows = [{
+        'student_id': student_id,
+        'class_id': class_id,
+        'last_exam_date': deltas.get('exam_date'),
+        **{name: deltas.get(name, 0) for name in ROLLUP_COUNTERS}
+    } for student_id, deltas in deltas_by_student.items() if student_id not in existing]
+    if new_rows:
+        db.session.execute(table.insert(), new_rows)
+
+def _bump_rollup(student_id, class_id, **deltas):
+    """Add deltas to a single rollup row, creating the row on first write"""
+    _bump_rollups(class_id, {student_id: deltas})
+
+def record_mark(mark):
+    """Fold a newly added mark into the rollup"""
+    _bump_rollup(mark.student_id, mark.class_id, exam_date=mark.exam_date,
+                 mark_count=1, mark_sum=mark.marks, percentage_sum=mark.get_percentage())
+
+def _upsert_attendance(rows):
+    """Insert or update attendance rows in one executemany round trip"""
+    table = Attendance.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'class_id', 'date'],
+            set_={'status': stmt.excluded.status}
+        )
+        db.session.execute(stmt, rows)
+        return
+    # Generic fallback: one UPDATE per existing row, one bulk INSERT for the rest
+    for row in rows:
+        updated = db.session.execute(
+            table.update().where(
+                (table.c.student_id == row['student_id']) &
+                (table.c.class_id == row['class_id']) &
+                (table.c.date == row['date'])
+            ).values(status=row['status'])
+        ).rowcount
+        row['_exists'] = bool(updated)
+    new_rows = [{k: v for k, v in row.items() if k != '_exists'} for row in rows if not row['_exists']]
+    if new_rows:
+        db.session.execute(table.insert(), new_rows)
+
+def save_attendance(class_id, statuses):
+    """Write attendance for many (student_id, date) pairs at once.
+
+    ``statuses`` maps ``(student_id, date)`` to a status. Existing statuses
+    are prefetched in one query so the rollup can be adjusted, then all
+    changes are written with a single upsert. Returns the number of rows
+    that changed.
+    """
+    if not statuses:
+        return 0
+    dates = {d for _, d in statuses}
+    previous = {
+        (student_id, d): status for student_id, d, status in
+        db.session.query(Attendance.student_id, Attendance.date, Attendance.status)
+        .filter(Attendance.class_id == class_id, Attendance.date.in_(dates))
+        .filter(Attendance.student_id.in_({s for s, _ in statuses})).all()
+    }
+
+    rows = []
+    rollup_deltas = {}
+    for (student_id, d), status in statuses.items():
+        previous_status = previous.get((student_id, d))
+        if status == previous_status:
+            continue
+        rows.append({'student_id': student_id, 'class_id': class_id, 'date': d, 'status': status})
+        deltas = rollup_deltas.setdefault(student_id, {})
+        if previous_status in ATTENDANCE_COUNTERS:
+            name = ATTENDANCE_COUNTERS[previous_status]
+            deltas[name] = deltas.get(name, 0) - 1
+        name = ATTENDANCE_COUNTERS[status]
+        deltas[name] = deltas.get(name, 0) + 1
+
+    if rows:
+        _upsert_attendance(rows)
+        _bump_rollups(class_id, rollup_deltas)
+        _update_attendance_bitmaps(class_id, rows)
+    return len(rows)
+
+def _update_attendance_bitmaps(class_id, rows):
+    """Apply changed attendance rows to their term bitmaps.
+
+    Like _bump_rollups(): one read of the affected bitmaps, then one
+    executemany UPDATE and one INSERT, whatever the number of students.
+    """
+    table = AttendanceBitmap.__table__
+    keys = {(row['student_id'], term_start(row['date'])) for row in rows}
+    terms = {
+        (student_id, start): TermAttendance.from_bytes(start, present, late, absent)
+        for student_id, start, present, late, absent in db.session.execute(
+            select(table.c.student_id, table.c.term_start, table.c.present, table.c.late, table.c.absent).where(
+                table.c.class_id == class_id,
+                table.c.student_id.in_({student_id for student_id, _ in keys}),
+                table.c.term_start.in_({start for _, start in keys})))
+    }
+    existing = set(terms)
+    for row in rows:
+        key = (row['student_id'], term_start(row['date']))
+        if key not in terms:
+            terms[key] = TermAttendance(key[1])
+        terms[key].set(row['date'], row['status'])
+
+    updated = [dict(terms[key].to_bytes(), row_student_id=key[0], row_term_start=key[1])
+               for key in keys & existing]
+    if updated:
+        db.session.execute(table.update().where(
+            (table.c.student_id == bindparam('row_student_id')) & (table.c.class_id == class_id) &
+            (table.c.term_start == bindparam('row_term_start'))
+        ).values({status: bindparam(status) for status in ('present', 'late', 'absent')}), updated)
+    new_rows = [dict(terms[key].to_bytes(), student_id=key[0], class_id=class_id, term_start=key[1])
+                for key in keys - existing]
+    if new_rows:
+        db.session.execute(table.insert(), new_rows)
+
+def _attendance_bitmap_rows(*criteria, batch_size=20000):
+    # One bitmap row per (student, class, term), built from the Attendance
+    # table in index order so only one enrollment's days are held at a time
+    rows = db.session.execute(
+        select(Attendance.student_id, Attendance.class_id, Attendance.date, Attendance.status)
+        .where(*criteria)
+        .order_by(Attendance.student_id, Attendance.class_id, Attendance.date)
+        .execution_options(yield_per=batch_size)
+    )
+    key, days = None, []
+    for student_id, class_id, day, status in rows:
+        if (student_id, class_id) != key:
+            yield from _bitmap_rows(key, days)
+            key, days = (student_id, class_id), []
+        days.append((day, status))
+    yield from _bitmap_rows(key, days)
+
+def _bitmap_rows(key, days):
+    for term in build_terms(days).values():
+        yield dict(student_id=key[0], class_id=key[1], term_start=term.start, **term.to_bytes())
+
+def rebuild_attendance_bitmaps():
+    """Rebuild every attendance bitmap from the Attendance table; returns how many were written"""
+    AttendanceBitmap.query.delete()
+    return _insert_batches(AttendanceBitmap, _attendance_bitmap_rows())
+
+def refresh_attendance_bitmaps(class_id, student_ids):
+    """Rebuild the bitmaps of several students in one class from the Attendance table"""
+    table = AttendanceBitmap.__table__
+    for chunk in _chunks(student_ids):
+        db.session.execute(table.delete().where(table.c.class_id == class_id, table.c.student_id.in_(chunk)))
+        rows = list(_attendance_bitmap_rows(Attendance.class_id == class_id, Attendance.student_id.in_(chunk)))
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+def get_attendance_terms(student_id, class_id):
+    """A student's attendance in a class as TermAttendance bitmaps, newest term first"""
+    return [bitmap.to_term() for bitmap in AttendanceBitmap.query.filter_by(student_id=student_id, class_id=class_id)
+            .order_by(AttendanceBitmap.term_start.desc())]
+
+def _raw_rollup_rows(student_id=None, class_id=None, student_ids=None):
+    """Recompute rollup values from the raw Mark/Attendance tables"""
+    mark_query = db.session.query(
+        Mark.student_id, Mark.class_id,
+        func.count(Mark.id), func.sum(Mark.marks),
+        func.sum(Mark.marks * 100.0 / Mark.max_marks), func.max(Mark.exam_date)
+    )
+    attendance_query = db.session.query(
+        Attendance.student_id, Attendance.class_id,
+        *(func.sum(case((Attendance.status == status, 1), else_=0)) for status in ATTENDANCE_COUNTERS)
+    )
+    enrolled_query = db.session.query(class_students.c.student_id, class_students.c.class_id)
+    if student_id is not None:
+        mark_query = mark_query.filter(Mark.student_id == student_id)
+        attendance_query = attendance_query.filter(Attendance.student_id == student_id)
+        enrolled_query = enrolled_query.filter(class_students.c.student_id == student_id)
+    if class_id is not None:
+        mark_query = mark_query.filter(Mark.class_id == class_id)
+        attendance_query = attendance_query.filter(Attendance.class_id == class_id)
+        enrolled_query = enrolled_query.filter(class_students.c.class_id == class_id)
+    if student_ids is not None:
+        mark_query = mark_query.filter(Mark.student_id.in_(student_ids))
+        attendance_query = attendance_query.filter(Attendance.student_id.in_(student_ids))
+        enrolled_query = enrolled_query.filter(class_students.c.student_id.in_(student_ids))
+
+    rows = {}
+    def row_for(key):
+        if key not in rows:
+            rows[key] = dict({name: 0 for name in ROLLUP_COUNTERS}, student_id=key[0], class_id=key[1], last_exam_date=None)
+        return rows[key]
+
+    for key in enrolled_query.all():
+        row_for(tuple(key))
+    for s_id, c_id, count, mark_sum, percentage_sum, last_exam_date in \
+            mark_query.group_by(Mark.student_id, Mark.class_id).all():
+        row = row_for((s_id, c_id))
+        row.update(mark_count=count, mark_sum=mark_sum or 0, percentage_sum=percentage_sum or 0,
+                   last_exam_date=last_exam_date)
+    for s_id, c_id, present, late, absent in \
+            attendance_query.group_by(Attendance.student_id, Attendance.class_id).all():
+        row_for((s_id, c_id)).update(present_count=present, late_count=late, absent_count=absent)
+    return rows
+
+def refresh_rollup(student_id, class_id):
+    """Recompute one (student, class) rollup row from the raw tables"""
+    refresh_rollups(class_id, [student_id])
+
+def refresh_rollups(class_id, student_ids):
+    """Recompute the rollup rows of several students in one class from the raw tables"""
+    class_id, student_ids = int(class_id), [int(student_id) for student_id in student_ids]
+    if not student_ids:
+        return
+    expected = _raw_rollup_rows(class_id=class_id, student_ids=student_ids)
+    existing = {row.student_id: row for row in StudentClassStats.query.filter(
+        StudentClassStats.class_id == class_id, StudentClassStats.student_id.in_(student_ids))}
+    for student_id in student_ids:
+        values = expected.get((student_id, class_id))
+        row = existing.get(student_id)
+        if values is None:
+            if row:
+                db.session.delete(row)
+            continue
+        if row is None:
+            row = existing[student_id] = StudentClassStats(student_id=student_id, class_id=class_id)
+            db.session.add(row)
+        for name in ROLLUP_COUNTERS + ('last_exam_date',):
+            setattr(row, name, values[name])
+
+def rebuild_rollup():
+    """Rebuild the whole rollup table and return rows that had drifted"""
+    expected = _raw_rollup_rows()
+    drift = []
+    seen = set()
+    for row in StudentClassStats.query.all():
+        key = (row.student_id, row.class_id)
+        seen.add(key)
+        values = expected.get(key)
+        if values is None:
+            drift.append((key, 'stale row'))
+            continue
+        for name in ROLLUP_COUNTERS + ('last_exam_date',):
+            actual, wanted = getattr(row, name), values[name]
+            if isinstance(wanted, float) and actual is not None:
+                mismatch = abs(actual - wanted) > 1e-6
+            else:
+                mismatch = actual != wanted
+            if mismatch:
+                drift.append((key, f'{name}: {actual} != {wanted}'))
+    drift.extend((key, 'missing row') for key in sorted(set(expected) - seen))
+
+    StudentClassStats.query.delete()
+    db.session.bulk_insert_mappings(StudentClassStats, list(expected.values()))
+    # The rebuilt rows restart at version 0, so move every class on instead
+    Class.query.update({Class.version: Class.version + 1}, synchronize_session=False)
+    db.session.commit()
+    return drift
+
+# ==================== PAGE VERSIONS ====================
+#
+# Student pages are cached by version rather than expired by time. The
+# rollup row's version moves with every mark and attendance write for that
+# student and class, and Class.version with every class-wide write
+# (announcements, assignments). A page's ETag is a digest of the versions
+# it was rendered from.
+
+def bump_class_version(class_id):
+    """Mark everything students see about a class as changed"""
+    Class.query.filter(Class.id == class_id).update({Class.version: Class.version + 1}, synchronize_session=False)
+
+def student_page_versions(user_id, class_id=None):
+    """Versions behind a student's pages, from one indexed query.
+
+    Returns ``(class_id, subject_id, class_version, rollup_version)`` for
+    every class the student is enrolled in, or only ``class_id``; empty
+    when the user has no student profile or isn't enrolled.
+    """
+    query = db.session.query(class_students.c.class_id, Class.subject_id, Class.version, StudentClassStats.version) \
+        .select_from(Student) \
+        .join(class_students, class_students.c.student_id == Student.id) \
+        .join(Class, Class.id == class_students.c.class_id) \
+        .outerjoin(StudentClassStats, (StudentClassStats.student_id == Student.id) &
+                   (StudentClassStats.class_id == Class.id)) \
+        .filter(Student.user_id == user_id)
+    if class_id is not None:
+        query = query.filter(class_students.c.class_id == class_id)
+    return [tuple(row) for row in query.order_by(class_students.c.class_id)]
+
+def versioned_page(namespace, versions, render):
+    """Serve ``render()``'s HTML with an ETag computed from ``versions``.
+
+    A browser revalidating an unchanged page gets a 304, and any other
+    request for it reuses the rendered HTML from the page cache, so
+    neither runs the page's own queries. Pages with flashed messages
+    waiting are always rendered fresh.
+    """
+    if session.get('_flashes'):
+        return render()
+    key = PageCache.make_key(namespace, {
+        'versions': versions,
+        'user': [session.get('user_id'), session.get('username'), session.get('role')],
+        'today': date.today(),
+        'revision': current_app.config['PAGE_CACHE_REVISION']
+    })
+    if key in request.if_none_match:
+        pages_not_modified.inc(endpoint=request.endpoint)
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(page_cache.get_or_render(key, render), mimetype='text/html')
+    response.set_etag(key)
+    # Private to the logged-in user; revalidate on every load
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _code_revision(app):
+    # Newest modification time of the app's own modules (every one loaded
+    # from its directory, not just app.py) and templates, so a deploy never
+    # answers 304 with a page rendered by the old code
+    modules = [getattr(module, '__file__', None) for module in list(sys.modules.values())]
+    paths = [path for path in modules if path and os.path.dirname(os.path.abspath(path)) == app.root_path]
+    paths += [entry.path for entry in os.scandir(os.path.join(app.root_path, app.template_folder))]
+    return max(os.path.getmtime(path) for path in paths)
+
+# ==================== STUDENT SEARCH ====================
+#
+# The enrollment typeahead matches a prefix of the username, email or roll
+# number, case-insensitively. Each field has an index on its lower() value,
+# so a prefix is a range scan on that index that stops after a page of
+# results instead of a scan of every student.
+
+# SQLite's lower() only folds ASCII, so the term is folded the same way;
+# str.lower() would also fold e.g. 'Ä' and then never match the index
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+def _prefix_range(term):
+    """``(low, high)`` such that ``low <= value < high`` exactly when value starts with ``term``.
+
+    ``high`` is None when no string sorts after every match (the term is
+    all U+10FFFF), meaning the range is open-ended.
+    """
+    stem = term.rstrip(chr(0x10FFFF))
+    if not stem:
+        return term, None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # Surrogates can't be stored as text; the next code point is U+E000
+        following = 0xE000
+    return term, stem[:-1] + chr(following)
+
+@lru_cache(maxsize=None)
+def student_search_statement(excluding_class, bounded=True):
+    """The SELECT behind search_students(), built once with bound parameters.
+
+    Takes ``low``, ``limit``, ``high`` when ``bounded`` and, when
+    ``excluding_class``, ``class_id``. Building the union costs far more
+    than running it, so it is built once per shape and reused.
+    """
+    limit = bindparam('limit', type_=db.Integer)
+
+    def matches(column, query):
+        key = func.lower(column)
+        query = query.where(key >= bindparam('low'))
+        if bounded:
+            query = query.where(key < bindparam('high'))
+        if excluding_class:
+            query = query.where(~select(class_students.c.student_id).where(
+                class_students.c.class_id == bindparam('class_id'),
+                class_students.c.student_id == Student.id).exists())
+        return select(query.order_by(key).limit(limit).subquery().c.id)
+
+    by_user = select(Student.id).join(User, User.id == Student.user_id)
+    ids = union(matches(User.username, by_user), matches(User.email, by_user),
+                matches(Student.roll_number, select(Student.id)))
+    return select(Student.id, User.username, User.email, Student.roll_number) \
+        .join(User, User.id == Student.user_id) \
+        .where(Student.id.in_(ids)) \
+        .order_by(User.username).limit(limit)
+
+def search_students(term, exclude_class_id=None, limit=20):
+    """Students whose username, email or roll number starts with ``term``.
+
+    Returns up to ``limit`` ``(id, username, email, roll_number)`` rows
+    ordered by username. Students already in ``exclude_class_id`` are
+    skipped by an anti-join inside each index scan, so they never use up
+    the limit.
+    """
+    term = term.strip().translate(_ASCII_LOWER)
+    if not term or limit <= 0:
+        return []
+    low, high = _prefix_range(term)
+    params = {'low': low, 'high': high, 'limit': limit, 'class_id': exclude_class_id}
+    statement = student_search_statement(exclude_class_id is not None, high is not None)
+    return db.session.execute(statement, params).all()
+
+def _chunks(values, size=500):
+    # Keeps IN lists under SQLite's bound parameter limit
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def enroll_students(class_id, student_ids):
+    """Add students to a class in bulk; returns how many were newly enrolled.
+
+    Students already in the class are left alone. The caller commits.
+    """
+    added = 0
+    for chunk in _chunks(dict.fromkeys(student_ids)):
+        enrolled = {student_id for (student_id,) in db.session.query(class_students.c.student_id).filter(
+            class_students.c.class_id == class_id, class_students.c.student_id.in_(chunk))}
+        new = [student_id for student_id in chunk if student_id not in enrolled]
+        if new:
+            db.session.execute(insert(class_students), [{'class_id': class_id, 'student_id': student_id}
+                                                        for student_id in new])
+            refresh_rollups(class_id, new)
+            added += len(new)
+    return added
+
+# ==================== PAGINATION ====================
+#
+# Lists use keyset (cursor) pagination: each page continues from the sort
+# key of the previous page's last row, so page N costs the same index range
+# scan as page 1 instead of an ever-growing OFFSET.
+
+def paginate_users(role=None, after_id=None, per_page=50):
+    """One page of users ordered by id; returns (users, next_cursor)"""
+    query = User.query
+    if role:
+        query = query.filter(User.role == role)
+    if after_id:
+        query = query.filter(User.id > after_id)
+    rows = query.order_by(User.id).limit(per_page + 1).all()
+    next_cursor = rows[per_page - 1].id if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+def _filter_marks(query, exam_type=None, date_from=None, date_to=None):
+    """Apply the exam type and date range filters to a Mark query or select"""
+    if exam_type:
+        query = query.filter(Mark.exam_type == exam_type)
+    if date_from:
+        query = query.filter(Mark.exam_date >= date_from)
+    if date_to:
+        query = query.filter(Mark.exam_date <= date_to)
+    return query
+
+def _filtered_class_marks(class_id, exam_type=None, date_from=None, date_to=None):
+    return _filter_marks(Mark.query.filter(Mark.class_id == class_id), exam_type, date_from, date_to)
+
+def paginate_class_marks(class_id, exam_type=None, date_from=None, date_to=None, cursor=None, per_page=50):
+    """One page of a class's marks, newest exam first; returns (marks, next_cursor).
+
+    ``cursor`` is the ``(exam_date, id)`` of the last mark on the previous
+    page. Marks without an exam date sort after all dated marks, and are
+    paged as a second segment so both segments stay index range scans.
+    """
+    base = _filtered_class_marks(class_id, exam_type, date_from, date_to) \
+        .options(joinedload(Mark.student).joinedload(Student.user))
+    rows = []
+    if cursor is None or cursor[0] is not None:
+        dated = base.filter(Mark.exam_date.isnot(None))
+        if cursor:
+            dated = dated.filter(tuple_(Mark.exam_date, Mark.id) < tuple_(*cursor))
+        rows = dated.order_by(Mark.exam_date.desc(), Mark.id.desc()).limit(per_page + 1).all()
+    if len(rows) <= per_page and not (date_from or date_to):
+        undated = base.filter(Mark.exam_date.is_(None))
+        if cursor and cursor[0] is None:
+            undated = undated.filter(Mark.id < cursor[1])
+        rows += undated.order_by(Mark.id.desc()).limit(per_page + 1 - len(rows)).all()
+    page = rows[:per_page]
+    next_cursor = (page[-1].exam_date, page[-1].id) if len(rows) > per_page else None
+    return page, next_cursor
+
+def encode_mark_cursor(cursor):
+    exam_date, mark_id = cursor
+    return f"{exam_date.isoformat() if exam_date else ''}_{mark_id}"
+
+def decode_mark_cursor(value):
+    """Parse a cursor from the query string, ignoring malformed values"""
+    try:
+        exam_date, mark_id = value.split('_')
+        return (datetime.strptime(exam_date, '%Y-%m-%d').date() if exam_date else None, int(mark_id))
+    except (AttributeError, ValueError):
+        return None
+
+def _page_size():
+    return min(max(request.args.get('per_page', 50, type=int), 1), 200)
+
+def _date_arg(name):
+    try:
+        return datetime.strptime(request.args.get(name, ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+# ==================== EXPORTS ====================
+#
+# Export queries are plain selects of the exported columns, so rows stream
+# from the cursor without building ORM objects. Each one is ordered along
+# an index, so the database can start returning rows without sorting the
+# whole result first.
+
+GRADEBOOK_COLUMNS = ('roll_number', 'student', 'exam_type', 'exam_date', 'marks', 'max_marks',
+                     'percentage', 'grade', 'remarks')
+TRANSCRIPT_COLUMNS = ('academic_year', 'subject', 'class', 'section', 'exam_type', 'exam_date', 'marks',
+                      'max_marks', 'percentage', 'grade', 'remarks')
+ATTENDANCE_COLUMNS = ('date', 'academic_year', 'class', 'section', 'subject', 'roll_number', 'student',
+                      'status', 'remarks')
+
+def gradebook_export_query(class_id, exam_type=None, date_from=None, date_to=None):
+    """Every mark in a class, oldest exam first; the column names match the gradebook import"""
+    query = select(Student.roll_number, User.username, Mark.exam_type, Mark.exam_date, Mark.marks, Mark.max_marks,
+                   func.round(mark_percentage(), 2), mark_grade(class_grade_scale(class_id)), Mark.remarks) \
+        .select_from(Mark).join(Student, Student.id == Mark.student_id).join(User, User.id == Student.user_id) \
+        .where(Mark.class_id == class_id)
+    return _filter_marks(query, exam_type, date_from, date_to).order_by(Mark.exam_date, Mark.id)
+
+def transcript_export_query(student_id, academic_year=None, exam_type=None, date_from=None, date_to=None):
+    """Every mark a student has, by academic year and exam date"""
+    query = select(Class.academic_year, Subject.name, Class.name, Class.section, Mark.exam_type, Mark.exam_date,
+                   Mark.marks, Mark.max_marks, func.round(mark_percentage(), 2), mark_grade(), Mark.remarks) \
+        .select_from(Mark).join(Class, Class.id == Mark.class_id).join(Subject, Subject.id == Mark.subject_id) \
+        .where(Mark.student_id == student_id)
+    if academic_year:
+        query = query.where(Class.academic_year == academic_year)
+    return _filter_marks(query, exam_type, date_from, date_to) \
+        .order_by(Class.academic_year, Mark.exam_date, Mark.id)
+
+def attendance_register_query(academic_year=None, date_from=None, date_to=None):
+    """School-wide attendance, class by class in date order"""
+    query = select(Attendance.date, Class.academic_year, Class.name, Class.section, Subject.name,
+                   Student.roll_number, User.username, Attendance.status, Attendance.remarks) \
+        .select_from(Attendance).join(Class, Class.id == Attendance.class_id) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .join(Student, Student.id == Attendance.student_id).join(User, User.id == Student.user_id)
+    if academic_year:
+        query = query.where(Class.academic_year == academic_year)
+    if date_from:
+        query = query.where(Attendance.date >= date_from)
+    if date_to:
+        query = query.where(Attendance.date <= date_to)
+    return query.order_by(Attendance.class_id, Attendance.date, Attendance.id)
+
+def stream_rows(statement, batch_size=1000):
+    """Yield the rows of ``statement`` as they are fetched.
+
+    ``yield_per`` makes SQLAlchemy fetch ``batch_size`` rows at a time
+    through a server-side cursor where the driver has one, so memory stays
+    flat however many rows match. The statement only runs once the
+    generator is first advanced.
+    """
+    yield from db.session.execute(statement.execution_options(yield_per=batch_size))
+
+# ==================== SCHEMA MIGRATIONS ====================
+#
+# db.create_all() only creates missing tables, so anything added to an
+# existing table (indexes, constraints, backfills) goes through MIGRATIONS.
+# Each entry runs once per database and is recorded in schema_migrations;
+# append new entries, never renumber old ones.
+
+def _dedupe_attendance():
+    # Keep only the newest record for any duplicated day before the unique index
+    db.session.execute(text(
+        'DELETE FROM attendance WHERE id NOT IN '
+        '(SELECT MAX(id) FROM attendance GROUP BY student_id, class_id, date)'
+    ))
+
+def _create_declared_indexes():
+    # IF NOT EXISTS rather than checkfirst: reflection can't see expression indexes
+    connection = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+def _backfill_rollup():
+    # rebuild_rollup() already uses the version columns of migration 6
+    _add_page_versions()
+    if Mark.query.first() or Attendance.query.first():
+        rebuild_rollup()
+
+def _add_missing_column(table, column, definition):
+    connection = db.session.connection()
+    if column not in {c['name'] for c in inspect(connection).get_columns(table)}:
+        quote = connection.dialect.identifier_preparer.quote
+        db.session.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} {definition}'))
+
+def _add_grading_scales():
+    connection = db.session.connection()
+    GradingScale.__table__.create(connection, checkfirst=True)
+    GradeBand.__table__.create(connection, checkfirst=True)
+    _add_missing_column('subject', 'grading_scale_id', 'INTEGER REFERENCES grading_scale (id)')
+    # The cutoffs that used to be hard-coded become the editable default scale
+    if not db.session.query(GradingScale.id).first():
+        db.session.add(GradingScale(name='Standard (A-F)', is_default=True,
+                                    bands=[GradeBand(letter=letter, min_percentage=cutoff) for letter, cutoff in DEFAULT_BANDS]))
+
+def _add_page_versions():
+    _add_missing_column('class', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    _add_missing_column('student_class_stats', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+def _add_attendance_bitmaps():
+    AttendanceBitmap.__table__.create(db.session.connection(), checkfirst=True)
+    if not db.session.query(AttendanceBitmap.student_id).first():
+        rebuild_attendance_bitmaps()
+
+MIGRATIONS = [
+    (1, 'Remove duplicate attendance days', _dedupe_attendance),
+    (2, 'Create declared composite and unique indexes', _create_declared_indexes),
+    (3, 'Backfill the student/class rollup', _backfill_rollup),
+    (4, 'Create indexes for paginated user and mark lists', _create_declared_indexes),
+    (5, 'Add configurable grading scales', _add_grading_scales),
+    (6, 'Add page version counters to classes and the rollup', _add_page_versions),
+    (7, 'Create lower-case indexes for student search', _create_declared_indexes),
+    (8, 'Pack attendance history into per-term bitmaps', _add_attendance_bitmaps),
+]
+
+def migrate_database():
+    """Apply pending MIGRATIONS and return the descriptions of those applied"""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    applied = {version for (version,) in db.session.query(SchemaMigration.version)}
+    ran = []
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        migration()
+        db.session.add(SchemaMigration(version=version, description=description))
+        db.session.commit()
+        ran.append(f'{version}: {description}')
+    if ran:
+        grade_scale_cache.invalidate()
+    return ran
+
+# ==================== QUERY PLAN CHECKS ====================
+
+def _query_plan_checks(class_id=1, student_id=1):
+    """Main query of each hot route paired with the index it must use"""
+    search = student_search_statement(True).params(low='stu', high='stv', limit=20, class_id=class_id)
+    return [
+        ('student_view_class marks',
+         Mark.query.filter_by(student_id=student_id, class_id=class_id).order_by(Mark.exam_date.desc()),
+         'ix_mark_student_class_date'),
+        ('student attendance calendar',
+         AttendanceBitmap.query.filter_by(student_id=student_id, class_id=class_id)
+         .order_by(AttendanceBitmap.term_start.desc()),
+         'sqlite_autoindex_attendance_bitmap_1'),
+        ('manage_attendance today',
+         Attendance.query.filter_by(class_id=class_id, date=date.today()),
+         'ix_attendance_class_date'),
+        ('manage_marks page',
+         Mark.query.filter(Mark.class_id == class_id, Mark.exam_date.isnot(None),
+                           tuple_(Mark.exam_date, Mark.id) < tuple_(date.today(), 1000))
+         .order_by(Mark.exam_date.desc(), Mark.id.desc()).limit(50),
+         'ix_mark_class_date'),
+        ('manage_marks page by exam type',
+         Mark.query.filter(Mark.class_id == class_id, Mark.exam_type == 'quiz', Mark.exam_date.isnot(None))
+         .order_by(Mark.exam_date.desc(), Mark.id.desc()).limit(50),
+         'ix_mark_class_type_date'),
+        ('admin users by role',
+         User.query.filter(User.role == 'student', User.id > 100).order_by(User.id).limit(50),
+         'ix_user_role'),
+        ('class grade distribution',
+         db.session.query(mark_grade(), func.count(Mark.id)).filter(Mark.class_id == class_id).group_by(mark_grade()),
+         'ix_mark_class_date'),
+        ('student percentage series',
+         db.session.query(Mark.exam_date, mark_percentage()).filter(Mark.student_id == student_id),
+         'ix_mark_student_class_date'),
+        ('student page versions',
+         db.session.query(class_students.c.class_id, Class.version, StudentClassStats.version).select_from(Student)
+         .join(class_students, class_students.c.student_id == Student.id).join(Class, Class.id == class_students.c.class_id)
+         .outerjoin(StudentClassStats, (StudentClassStats.student_id == Student.id) & (StudentClassStats.class_id == Class.id))
+         .filter(Student.user_id == student_id),
+         'ix_class_students_student'),
+        ('student search by username', search, 'ix_user_username_lower'),
+        ('student search by email', search, 'ix_user_email_lower'),
+        ('student search by roll number', search, 'ix_student_roll_number_lower'),
+        ('student dashboard classes',
+         db.session.query(class_students.c.class_id).filter(class_students.c.student_id == student_id),
+         'ix_class_students_student'),
+        ('class rollup rows',
+         StudentClassStats.query.filter_by(class_id=class_id),
+         'ix_student_class_stats_class'),
+        ('gradebook export',
+         gradebook_export_query(class_id, date_from=date(2000, 1, 1)),
+         'ix_mark_class_date'),
+        ('attendance register export',
+         attendance_register_query(date_from=date(2000, 1, 1)),
+         'ix_attendance_class_date'),
+        ('subject statistics',
+         select(Mark.student_id, Mark.exam_type, mark_percentage())
+         .where(Mark.class_id.in_(select(Class.id).where(Class.subject_id == 1))),
+         'ix_mark_class_date'),
+    ]
+
+def explain_query_plans():
+    """Run EXPLAIN QUERY PLAN for each hot query shape (SQLite only).
+
+    Returns ``(name, expected_index, plan_lines, ok)`` tuples.
+    """
+    connection = db.session.connection()
+    results = []
+    for name, query, expected_index in _query_plan_checks():
+        statement = query.statement if hasattr(query, 'statement') else query
+        compiled = statement.compile(dialect=connection.dialect)
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+        plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params)]
+        ok = any(expected_index in line for line in plan)
+        results.append((name, expected_index, plan, ok))
+    return results
+
+# ==================== QUERY COUNT CHECKS ====================
+
+# Upper bound on SQL statements for one page view. Pages load their
+# relationships with explicit loader options or grouped count queries, so
+# the number of statements must not grow with classes, students or marks.
+PAGE_QUERY_BUDGET = 15
+
+def _busiest(column, group_column):
+    return db.session.query(group_column).select_from(class_students).join(Class) \
+        .group_by(group_column).order_by(func.count(column).desc()).limit(1).scalar()
+
+def _page_query_checks():
+    """``(name, user, url)`` for the largest teacher, student and class in the database"""
+    checks = []
+    teacher = db.session.get(Teacher, _busiest(class_students.c.student_id, Class.teacher_id) or 0) \
+        or Teacher.query.first()
+    if teacher:
+        checks.append(('teacher dashboard', teacher.user, url_for('main.teacher_dashboard')))
+    class_id = _busiest(class_students.c.student_id, class_students.c.class_id)
+    class_obj = db.session.get(Class, class_id) if class_id else Class.query.first()
+    if class_obj:
+        for name, endpoint in [('class detail', 'view_class'), ('manage marks', 'manage_marks'),
+                               ('manage attendance', 'manage_attendance'), ('class analytics', 'class_analytics'),
+                               ('class analytics api', 'class_analytics_api'),
+                               ('announcements', 'manage_announcements'), ('assignments', 'manage_assignments')]:
+            checks.append((name, class_obj.teacher.user, url_for(f'main.{endpoint}', class_id=class_obj.id)))
+    student = db.session.get(Student, _busiest(class_students.c.class_id, class_students.c.student_id) or 0) \
+        or Student.query.first()
+    if student:
+        checks.append(('student dashboard', student.user, url_for('main.student_dashboard')))
+        if student.classes:
+            checks.append(('student class view', student.user,
+                           url_for('main.student_view_class', class_id=student.classes[0].id)))
+    admin = User.query.filter_by(role='admin').first()
+    if admin:
+        checks.append(('admin dashboard', admin, url_for('main.admin_dashboard')))
+    return checks
+
+def _client_for(user):
+    """A test client already logged in as ``user``"""
+    client = current_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+        sess['role'] = user.role
+    return client
+
+def count_page_queries(user, url):
+    """Fetch ``url`` as ``user`` and return ``(status_code, statement_count)``"""
+    statements = []
+    def count_statement(*args):
+        statements.append(args[2])
+    client = _client_for(user)
+    # A fresh app context gives the request its own session and ``g``, so
+    # objects loaded earlier (or cached for another user) aren't reused
+    with current_app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return response.status_code, len(statements)
+
+# ==================== SYNTHETIC DATA ====================
+
+SEED_SUBJECTS = [
+    ('Mathematics', 'MATH'), ('Physics', 'PHY'), ('Chemistry', 'CHEM'), ('Biology', 'BIO'),
+    ('English', 'ENG'), ('History', 'HIST'), ('Geography', 'GEO'), ('Computer Science', 'CS'),
+    ('Economics', 'ECON'), ('Art', 'ART'), ('Music', 'MUS'), ('Physical Education', 'PE'),
+]
+SEED_EXAM_TYPES = ('quiz', 'assignment', 'quiz', 'midterm', 'quiz', 'project', 'assignment', 'final')
+SEED_TERM_START = date(2026, 1, 5)
+SEED_PASSWORD = 'password'
+
+def _school_days(count, start=SEED_TERM_START):
+    days, day = [], start
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def _insert_batches(model, rows, batch_size=20000):
+    """Bulk insert an iterable of row dicts in executemany batches"""
+    count, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+        count += len(batch)
+    return count
+
+def seed_school(students=1000, teachers=40, classes=60, classes_per_student=4,
+                marks_per_enrollment=8, attendance_days=40, seed=42):
+    """Generate a deterministic synthetic school into an empty database.
+
+    The same arguments always produce the same rows. Every seeded user's
+    password is ``SEED_PASSWORD``. Returns the number of rows per table.
+    """
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    created = datetime.combine(SEED_TERM_START, datetime.min.time()) - timedelta(days=7)
+    first_user_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    classes_per_student = min(classes_per_student, classes)
+    counts = {}
+
+    counts['subject'] = _insert_batches(Subject, (
+        {'id': i + 1, 'name': name, 'code': code, 'description': f'{name} curriculum', 'created_at': created}
+        for i, (name, code) in enumerate(SEED_SUBJECTS)
+    ))
+    counts['user'] = _insert_batches(User, (
+        {'id': first_user_id + i, 'username': f'teacher{i + 1:05d}' if i < teachers else f'student{i - teachers + 1:06d}',
+         'email': f'teacher{i + 1:05d}@school.test' if i < teachers else f'student{i - teachers + 1:06d}@school.test',
+         'password_hash': password_hash, 'role': 'teacher' if i < teachers else 'student', 'created_at': created}
+        for i in range(teachers + students)
+    ))
+    counts['teacher'] = _insert_batches(Teacher, (
+        {'id': i + 1, 'user_id': first_user_id + i, 'employee_id': f'T{i + 1:05d}', 'created_at': created}
+        for i in range(teachers)
+    ))
+    counts['student'] = _insert_batches(Student, (
+        {'id': i + 1, 'user_id': first_user_id + teachers + i, 'roll_number': f'S{i + 1:06d}', 'created_at': created}
+        for i in range(students)
+    ))
+    counts['class'] = _insert_batches(Class, (
+        {'id': j + 1, 'name': f'{SEED_SUBJECTS[j % len(SEED_SUBJECTS)][0]} {j // len(SEED_SUBJECTS) + 1}',
+         'section': 'ABCD'[j % 4], 'teacher_id': j % teachers + 1, 'subject_id': j % len(SEED_SUBJECTS) + 1,
+         'academic_year': '2025-2026', 'created_at': created}
+        for j in range(classes)
+    ))
+
+    # Every class sits the same exams; students differ in ability and punctuality
+    days = _school_days(max(attendance_days, 1))
+    exams = {
+        class_id: sorted((rng.choice(days), SEED_EXAM_TYPES[k % len(SEED_EXAM_TYPES)])
+                         for k in range(marks_per_enrollment))
+        for class_id in range(1, classes + 1)
+    }
+    enrollments = [(student_id, class_id + 1)
+                   for student_id in range(1, students + 1)
+                   for class_id in sorted(rng.sample(range(classes), classes_per_student))]
+    ability = [0] + [rng.gauss(70, 12) for _ in range(students)]
+    absence_rate = [0] + [rng.uniform(0.02, 0.15) for _ in range(students)]
+    rollup = {key: dict({name: 0 for name in ROLLUP_COUNTERS}, student_id=key[0], class_id=key[1], last_exam_date=None)
+              for key in enrollments}
+
+    counts['class_students'] = _insert_batches(class_students, (
+        {'student_id': student_id, 'class_id': class_id, 'enrolled_at': created}
+        for student_id, class_id in enrollments
+    ))
+
+    def mark_rows():
+        for student_id, class_id in enrollments:
+            stats = rollup[(student_id, class_id)]
+            for exam_date, exam_type in exams[class_id]:
+                marks = round(min(100.0, max(0.0, rng.gauss(ability[student_id], 10))) * 2) / 2
+                stats['mark_count'] += 1
+                stats['mark_sum'] += marks
+                stats['percentage_sum'] += marks
+                stats['last_exam_date'] = exam_date
+                yield {'student_id': student_id, 'class_id': class_id, 'subject_id': (class_id - 1) % len(SEED_SUBJECTS) + 1,
+                       'marks': marks, 'max_marks': 100.0, 'exam_type': exam_type, 'exam_date': exam_date,
+                       'remarks': '', 'created_at': created}
+
+    bitmaps = []
+    def attendance_rows():
+        for student_id, class_id in enrollments:
+            stats = rollup[(student_id, class_id)]
+            history = []
+            for day in days[:attendance_days]:
+                roll = rng.random()
+                status = 'absent' if roll < absence_rate[student_id] else \
+                    'late' if roll < absence_rate[student_id] * 1.5 else 'present'
+                stats[ATTENDANCE_COUNTERS[status]] += 1
+                history.append((day, status))
+                yield {'student_id': student_id, 'class_id': class_id, 'date': day, 'status': status,
+                       'created_at': created}
+            bitmaps.extend(_bitmap_rows((student_id, class_id), history))
+
+    counts['mark'] = _insert_batches(Mark, mark_rows())
+    counts['attendance'] = _insert_batches(Attendance, attendance_rows())
+    counts['attendance_bitmap'] = _insert_batches(AttendanceBitmap, bitmaps)
+    counts['student_class_stats'] = _insert_batches(StudentClassStats, rollup.values())
+    counts['announcement'] = _insert_batches(Announcement, (
+        {'class_id': class_id, 'title': f'Week {week} notes', 'content': 'Reading for the week is on the board.',
+         'created_at': created}
+        for class_id in range(1, classes + 1) for week in (1, 2)
+    ))
+    counts['assignment'] = _insert_batches(Assignment, (
+        {'class_id': class_id, 'title': f'Problem set {n}', 'description': 'Complete all questions.',
+         'due_date': days[min(len(days) - 1, n * 5)], 'max_marks': 20.0, 'created_at': created}
+        for class_id in range(1, classes + 1) for n in (1, 2)
+    ))
+    db.session.commit()
+    return counts
+
+# ==================== BENCHMARKS ====================
+
+BENCHMARK_REMARK = 'benchmark run'
+
+def _benchmark_attendance_date(class_id):
+    # A Sunday the class has no attendance on, so the mark-attendance case
+    # only adds rows and cleanup can delete them all. The seed never
+    # records weekends, and the first Sunday tried is in the seeded term,
+    # so marking it updates existing attendance bitmaps.
+    recorded = {day for (day,) in db.session.query(Attendance.date).filter(Attendance.class_id == class_id).distinct()}
+    day = SEED_TERM_START - timedelta(days=SEED_TERM_START.isoweekday())
+    while day in recorded:
+        day -= timedelta(days=7)
+    return day
+
+def _benchmark_cases():
+    """One benchmark case per route, run as the largest teacher, class and student"""
+    class_id = _busiest(class_students.c.student_id, class_students.c.class_id)
+    class_obj = db.session.get(Class, class_id) if class_id else Class.query.first()
+    student_id = _busiest(class_students.c.class_id, class_students.c.student_id)
+    student = db.session.get(Student, student_id) if student_id else Student.query.first()
+    admin = User.query.filter_by(role='admin').first()
+    if not (class_obj and student and admin):
+        return []
+    enrolled = [s.id for s in class_obj.students]
+    attendance_date = _benchmark_attendance_date(class_obj.id)
+    last_page = User.query.order_by(User.id.desc()).offset(50).first()
+
+    anonymous, teacher, pupil, administrator = (current_app.test_client(), _client_for(class_obj.teacher.user),
+                                                _client_for(student.user), _client_for(admin))
+    with current_app.test_request_context():
+        cases = [
+            ('home', anonymous, url_for('main.home')),
+            ('login form', anonymous, url_for('main.login')),
+            ('admin dashboard', administrator, url_for('main.admin_dashboard')),
+            ('admin dashboard last page', administrator,
+             url_for('main.admin_dashboard', after=last_page.id if last_page else None)),
+            ('teacher dashboard', teacher, url_for('main.teacher_dashboard')),
+            ('class detail', teacher, url_for('main.view_class', class_id=class_obj.id)),
+            ('manage marks', teacher, url_for('main.manage_marks', class_id=class_obj.id)),
+            ('manage attendance', teacher, url_for('main.manage_attendance', class_id=class_obj.id)),
+            ('attendance week', teacher, url_for('main.manage_attendance', class_id=class_obj.id, week=SEED_TERM_START)),
+            ('class analytics', teacher, url_for('main.class_analytics', class_id=class_obj.id)),
+            ('class chart', teacher, url_for('main.class_chart', class_id=class_obj.id)),
+            ('class analytics api', teacher, url_for('main.class_analytics_api', class_id=class_obj.id)),
+            ('announcements', teacher, url_for('main.manage_announcements', class_id=class_obj.id)),
+            ('assignments', teacher, url_for('main.manage_assignments', class_id=class_obj.id)),
+            ('student dashboard', pupil, url_for('main.student_dashboard')),
+            ('student class view', pupil, url_for('main.student_view_class', class_id=student.classes[0].id)),
+            ('student analytics', pupil, url_for('main.student_analytics')),
+            ('student chart', pupil, url_for('main.student_chart')),
+            ('student analytics api', pupil, url_for('main.student_analytics_api')),
+            ('metrics', administrator, url_for('main.metrics_endpoint')),
+        ]
+        cases = [{'name': name, 'client': client, 'url': url} for name, client, url in cases]
+        cases += [
+            {'name': 'add mark', 'client': teacher, 'method': 'post',
+             'url': url_for('main.add_mark', class_id=class_obj.id),
+             'data': {'student_id': enrolled[0], 'marks': 75, 'max_marks': 100, 'exam_type': 'quiz',
+                      'exam_date': SEED_TERM_START.isoformat(), 'remarks': BENCHMARK_REMARK}},
+            {'name': 'mark attendance', 'client': teacher, 'method': 'post',
+             'url': url_for('main.mark_attendance', class_id=class_obj.id),
+             'data': dict({f'status_{sid}': 'present' for sid in enrolled}, date=attendance_date.isoformat()),
+             'attendance': (class_obj.id, attendance_date)},
+        ]
+    return cases
+
+def remove_benchmark_writes(cases):
+    """Delete the marks and attendance written by the benchmark ``cases`` so reruns see the same data.
+
+    A case that marks attendance names its ``(class_id, date)``, a day that
+    had no attendance before the run. Rollups and attendance bitmaps of the
+    affected students are rebuilt from what remains. Returns how many rows
+    were deleted.
+    """
+    marks = Mark.query.filter_by(remarks=BENCHMARK_REMARK).all()
+    for mark in marks:
+        db.session.delete(mark)
+    db.session.flush()
+    for student_id, class_id in {(mark.student_id, mark.class_id) for mark in marks}:
+        refresh_rollup(student_id, class_id)
+
+    removed = len(marks)
+    for class_id, day in {case['attendance'] for case in cases if 'attendance' in case}:
+        written = Attendance.query.filter_by(class_id=class_id, date=day)
+        student_ids = [student_id for (student_id,) in written.with_entities(Attendance.student_id)]
+        removed += written.delete(synchronize_session=False)
+        refresh_rollups(class_id, student_ids)
+        refresh_attendance_bitmaps(class_id, student_ids)
+    db.session.commit()
+    return removed
+
+def benchmark_dataset():
+    """Table sizes recorded next to benchmark results"""
+    return {model.__tablename__: db.session.query(func.count()).select_from(model).scalar()
+            for model in (User, Student, Class, Mark, Attendance)}
+
+# ==================== LOAD TEST PLANS ====================
+
+def load_test_plans(teachers=10, students=50, admins=1, password=SEED_PASSWORD, admin_password='admin123'):
+    """Virtual users for the load test as ``(role, plan)`` pairs.
+
+    Each teacher takes attendance for one of the largest classes (one class
+    per teacher account); students and admins are the first enrolled
+    students and the admin accounts.
+    """
+    dates = [d.isoformat() for d in _school_days(20, start=date.today() - timedelta(days=27))]
+    plans = []
+    class_sizes = db.session.query(Class.id, Class.teacher_id, User.username, func.count(class_students.c.student_id)) \
+        .join(Teacher, Teacher.id == Class.teacher_id).join(User, User.id == Teacher.user_id) \
+        .join(class_students, class_students.c.class_id == Class.id) \
+        .group_by(Class.id).order_by(func.count(class_students.c.student_id).desc(), Class.id).all()
+    seen_teachers = set()
+    for class_id, teacher_id, username, _ in class_sizes:
+        if len(seen_teachers) >= teachers:
+            break
+        if teacher_id in seen_teachers:
+            continue
+        seen_teachers.add(teacher_id)
+        student_ids = [sid for (sid,) in db.session.query(class_students.c.student_id)
+                       .filter(class_students.c.class_id == class_id)]
+        plans.append(('teacher', {'username': username, 'password': password, 'class_id': class_id,
+                                  'student_ids': student_ids, 'dates': dates}))
+    enrolled = db.session.query(class_students.c.student_id).distinct()
+    for (username,) in db.session.query(User.username).join(Student, Student.user_id == User.id) \
+            .filter(Student.id.in_(enrolled)).order_by(Student.id).limit(students):
+        plans.append(('student', {'username': username, 'password': password}))
+    admin_names = [name for (name,) in db.session.query(User.username).filter(User.role == 'admin').order_by(User.id)]
+    for i in range(admins if admin_names else 0):
+        plans.append(('admin', {'username': admin_names[i % len(admin_names)], 'password': admin_password}))
+    return plans
+
 # ==================== HELPER FUNCTIONS ====================
 
 def create_tables():
-    with app.app_context():
-        db.create_all()
-        # Create default admin user if not exists
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@school.com',
-                password_hash=generate_password_hash('admin123'),
-                role='admin'
-            )
-            db.session.add(admin)
-            db.session.commit()
-            print("Default admin created: username='admin', password='admin123'")
+    db.create_all()
+    migrate_database()
+    # Create default admin user if not exists
+    admin = User.query.filter_by(username='admin').first()
+    if not admin:
+        admin = User(
+            username='admin',
+            email='admin@school.com',
+            password_hash=generate_password_hash('admin123'),
+            role='admin'
+        )
+        db.session.add(admin)
+        db.session.commit()
+        print("Default admin created: username='admin', password='admin123'")
+
+# ==================== REQUEST CONTEXT ====================
+
+def current_user():
+    """The logged-in User, loaded once per request and cached on ``g``.
+
+    The cache is keyed by the session's user id, so logging in or out
+    mid-request (or test clients sharing an app context) never sees a
+    stale user.
+    """
+    user_id = session.get('user_id')
+    cached = g.get('current_user')
+    if cached is None or cached[0] != user_id:
+        cached = g.current_user = (user_id, db.session.get(User, user_id) if user_id else None)
+    return cached[1]
+
+def current_teacher():
+    """The logged-in user's Teacher profile, if any"""
+    user = current_user()
+    # The relationship stays loaded on the cached user after the first access
+    return user.teacher_profile if user else None
+
+def current_student():
+    """The logged-in user's Student profile, if any"""
+    user = current_user()
+    return user.student_profile if user else None
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -198,11 +1696,11 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
-        user = db.session.get(User, session['user_id'])
+            return redirect(url_for('main.login'))
+        user = current_user()
         if not user or user.role != 'admin':
             flash('Admin access required.', 'danger')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -211,23 +1709,56 @@ def teacher_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
-        user = db.session.get(User, session['user_id'])
+            return redirect(url_for('main.login'))
+        user = current_user()
         if not user or user.role not in ['teacher', 'admin']:
             flash('Teacher access required.', 'danger')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
+def _deny_page():
+    flash('Access denied!', 'danger')
+    return redirect(url_for('main.teacher_dashboard'))
+
+def _deny_forbidden():
+    abort(403)
+
+def _deny_json():
+    return jsonify({'error': 'Access denied'}), 403
+
+def owns_class(class_obj):
+    """Whether the current user teaches ``class_obj`` or is an admin"""
+    user = current_user()
+    return user.role == 'admin' or class_obj.teacher.user_id == user.id
+
+def class_owner_required(*options, denied=_deny_page):
+    """Load the route's class once and check the current teacher owns it (admins pass).
+
+    Apply below ``@teacher_required``. ``options`` are loader options for
+    the relationships the view uses; the class reaches the view as
+    ``class_obj``. ``denied`` builds the response for other teachers.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            class_obj = Class.query.options(joinedload(Class.teacher), *options) \
+                .filter_by(id=kwargs['class_id']).first_or_404()
+            if not owns_class(class_obj):
+                return denied()
+            return f(*args, class_obj=class_obj, **kwargs)
+        return decorated_function
+    return decorator
+
 # ==================== AUTHENTICATION ROUTES ====================
 
-@app.route('/')
+@bp.route('/')
 def home():
     if 'user_id' in session:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('home.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -237,15 +1768,15 @@ def register():
         
         if User.query.filter_by(username=username).first():
             flash('Username already exists!', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         if User.query.filter_by(email=email).first():
             flash('Email already exists!', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         if password != repassword:
             flash('Passwords do not match!', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         try:
             # Create user with 'student' role by default
@@ -267,15 +1798,15 @@ def register():
             db.session.commit()
             
             flash('Registration successful! You can now log in as a student.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         except Exception as e:
             db.session.rollback()
             flash(f'An error occurred: {str(e)}', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -288,56 +1819,72 @@ def login():
             session['username'] = user.username
             session['role'] = user.role
             flash(f'Welcome back, {user.username}!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid username or password', 'danger')
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 # ==================== DASHBOARD ROUTES ====================
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     
     if user.role == 'admin':
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     elif user.role == 'teacher':
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
     else:  # student
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
 
 # ==================== ADMIN ROUTES ====================
 
-@app.route('/admin/dashboard')
+@bp.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    users = User.query.all()
+    role = request.args.get('role') or None
+    users, next_cursor = paginate_users(role, request.args.get('after', type=int), _page_size())
     subjects = Subject.query.all()
+    scales = GradingScale.query.options(selectinload(GradingScale.bands)) \
+        .order_by(GradingScale.is_default.desc(), GradingScale.name).all()
+    
+    # All dashboard counts in one round trip
+    count_users = select(func.count(User.id))
+    counts = db.session.execute(select(
+        count_users.scalar_subquery(),
+        count_users.where(User.role == 'student').scalar_subquery(),
+        count_users.where(User.role == 'teacher').scalar_subquery(),
+        select(func.count(Subject.id)).scalar_subquery(),
+        select(func.count(Class.id)).scalar_subquery(),
+        (count_users.where(User.role == role) if role else count_users).scalar_subquery()
+    )).one()
     stats = {
-        'total_users': User.query.count(),
-        'total_students': User.query.filter_by(role='student').count(),
-        'total_teachers': User.query.filter_by(role='teacher').count(),
-        'total_subjects': Subject.query.count(),
-        'total_classes': Class.query.count()
+        'total_users': counts[0],
+        'total_students': counts[1],
+        'total_teachers': counts[2],
+        'total_subjects': counts[3],
+        'total_classes': counts[4],
+        'filtered_users': counts[5]
     }
-    return render_template('admin_dashboard.html', users=users, subjects=subjects, stats=stats)
+    return render_template('admin_dashboard.html', users=users, subjects=subjects, scales=scales, stats=stats,
+                           role=role, next_cursor=next_cursor)
 
-@app.route('/admin/designate_teacher/<int:user_id>', methods=['POST'])
+@bp.route('/admin/designate_teacher/<int:user_id>', methods=['POST'])
 @admin_required
 def designate_teacher(user_id):
     user = User.query.get_or_404(user_id)
     
     if user.role == 'admin':
         flash('Cannot modify admin role!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     try:
         if user.role == 'student':
@@ -360,16 +1907,16 @@ def designate_teacher(user_id):
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
 
-@app.route('/admin/revoke_teacher/<int:user_id>', methods=['POST'])
+@bp.route('/admin/revoke_teacher/<int:user_id>', methods=['POST'])
 @admin_required
 def revoke_teacher(user_id):
     user = User.query.get_or_404(user_id)
     
     if user.role == 'admin':
         flash('Cannot modify admin role!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     try:
         if user.role == 'teacher':
@@ -392,9 +1939,9 @@ def revoke_teacher(user_id):
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
 
-@app.route('/admin/add_subject', methods=['POST'])
+@bp.route('/admin/add_subject', methods=['POST'])
 @admin_required
 def add_subject():
     name = request.form.get('name')
@@ -403,15 +1950,15 @@ def add_subject():
     
     if not name or not code:
         flash('Subject name and code are required!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     if Subject.query.filter_by(name=name).first():
         flash('Subject name already exists!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     if Subject.query.filter_by(code=code).first():
         flash('Subject code already exists!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     try:
         subject = Subject(name=name, code=code, description=description)
@@ -422,9 +1969,9 @@ def add_subject():
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
 
-@app.route('/admin/delete_subject/<int:subject_id>', methods=['POST'])
+@bp.route('/admin/delete_subject/<int:subject_id>', methods=['POST'])
 @admin_required
 def delete_subject(subject_id):
     subject = Subject.query.get_or_404(subject_id)
@@ -432,7 +1979,7 @@ def delete_subject(subject_id):
     # Check if subject is being used in any classes
     if subject.classes:
         flash(f'Cannot delete "{subject.name}" - it is being used in {len(subject.classes)} class(es)!', 'danger')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     try:
         db.session.delete(subject)
@@ -442,36 +1989,161 @@ def delete_subject(subject_id):
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
+
+def _grading_scale_form():
+    """Name and bands posted by a grading scale form; raises GradeScaleError"""
+    name = (request.form.get('name') or '').strip()
+    if not name:
+        raise GradeScaleError('Grading scale name is required!')
+    return name, [GradeBand(letter=letter, min_percentage=cutoff)
+                  for letter, cutoff in parse_bands(request.form.get('bands', ''))]
+
+def _make_default_scale(scale):
+    GradingScale.query.filter(GradingScale.id != scale.id).update({'is_default': False})
+    scale.is_default = True
+
+@bp.route('/admin/grading_scales/add', methods=['POST'])
+@admin_required
+def add_grading_scale():
+    try:
+        name, bands = _grading_scale_form()
+    except GradeScaleError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    if GradingScale.query.filter_by(name=name).first():
+        flash('Grading scale name already exists!', 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    try:
+        scale = GradingScale(name=name, bands=bands)
+        db.session.add(scale)
+        db.session.flush()
+        if request.form.get('is_default'):
+            _make_default_scale(scale)
+        db.session.commit()
+        grade_scale_cache.invalidate()
+        flash(f'Grading scale "{name}" added successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    
+    return redirect(url_for('main.admin_dashboard'))
+
+@bp.route('/admin/grading_scales/<int:scale_id>/update', methods=['POST'])
+@admin_required
+def update_grading_scale(scale_id):
+    scale = GradingScale.query.get_or_404(scale_id)
+    try:
+        name, bands = _grading_scale_form()
+    except GradeScaleError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    if GradingScale.query.filter(GradingScale.name == name, GradingScale.id != scale_id).first():
+        flash('Grading scale name already exists!', 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    try:
+        scale.name = name
+        scale.bands = bands
+        # The default only moves by making another scale the default, so
+        # there is always one; an unticked box leaves it alone
+        if request.form.get('is_default'):
+            _make_default_scale(scale)
+        db.session.commit()
+        grade_scale_cache.invalidate()
+        flash(f'Grading scale "{name}" updated successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    
+    return redirect(url_for('main.admin_dashboard'))
+
+@bp.route('/admin/grading_scales/<int:scale_id>/delete', methods=['POST'])
+@admin_required
+def delete_grading_scale(scale_id):
+    scale = GradingScale.query.get_or_404(scale_id)
+    
+    if scale.is_default:
+        flash(f'Cannot delete "{scale.name}" - it is the default grading scale!', 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    try:
+        # Its subjects fall back to the default scale
+        db.session.delete(scale)
+        db.session.commit()
+        grade_scale_cache.invalidate()
+        flash(f'Grading scale "{scale.name}" deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    
+    return redirect(url_for('main.admin_dashboard'))
+
+@bp.route('/admin/subject/<int:subject_id>/grading_scale', methods=['POST'])
+@admin_required
+def assign_grading_scale(subject_id):
+    subject = Subject.query.get_or_404(subject_id)
+    scale_id = request.form.get('scale_id', type=int)
+    
+    if scale_id is not None and not db.session.get(GradingScale, scale_id):
+        flash('Grading scale not found!', 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    try:
+        subject.grading_scale_id = scale_id
+        db.session.commit()
+        grade_scale_cache.invalidate()
+        flash(f'Grading scale for "{subject.name}" updated!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    
+    return redirect(url_for('main.admin_dashboard'))
+
+@bp.route('/admin/profiling')
+@admin_required
+def admin_profiling():
+    return render_template('admin_profiling.html', profiler=profiler,
+                           endpoints=profiler.worst_endpoints(), fingerprints=profiler.worst_fingerprints())
+
+@bp.route('/admin/profiling/reset', methods=['POST'])
+@admin_required
+def reset_profiling():
+    profiler.reset()
+    flash('Profiling statistics cleared.', 'success')
+    return redirect(url_for('main.admin_profiling'))
 
 # ==================== TEACHER ROUTES ====================
 
-@app.route('/teacher/dashboard')
+@bp.route('/teacher/dashboard')
 @teacher_required
 def teacher_dashboard():
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
+    teacher = current_teacher()
     
     if not teacher:
         flash('Teacher profile not found!', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
-    classes = teacher.classes
+    classes = Class.query.filter_by(teacher_id=teacher.id).options(joinedload(Class.subject)).order_by(Class.id).all()
+    student_counts = get_enrollment_counts([c.id for c in classes])
     stats = {
         'total_classes': len(classes),
-        'total_students': sum(len(c.students) for c in classes),
+        'total_students': sum(student_counts.values()),
         'subjects_taught': len(set(c.subject.name for c in classes))
     }
     
     subjects = Subject.query.all()
     
-    return render_template('teacher_dashboard.html', teacher=teacher, classes=classes, stats=stats, subjects=subjects)
+    return render_template('teacher_dashboard.html', teacher=teacher, classes=classes, stats=stats, subjects=subjects,
+                           student_counts=student_counts)
 
-@app.route('/teacher/add_class', methods=['POST'])
+@bp.route('/teacher/add_class', methods=['POST'])
 @teacher_required
 def add_class():
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
+    teacher = current_teacher()
     
     name = request.form.get('name')
     section = request.form.get('section')
@@ -480,7 +2152,7 @@ def add_class():
     
     if not all([name, subject_id]):
         flash('Class name and subject are required!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
     
     try:
         new_class = Class(
@@ -497,73 +2169,57 @@ def add_class():
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('teacher_dashboard'))
+    return redirect(url_for('main.teacher_dashboard'))
 
-@app.route('/teacher/class/<int:class_id>')
+@bp.route('/teacher/class/<int:class_id>')
 @teacher_required
-def view_class(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
-    # Get all students not in this class
-    enrolled_student_ids = [s.id for s in class_obj.students]
-    available_students = Student.query.filter(Student.id.notin_(enrolled_student_ids)).all() if enrolled_student_ids else Student.query.all()
-    
-    return render_template('class_detail.html', class_obj=class_obj, available_students=available_students)
+@class_owner_required(*CLASS_ROSTER)
+def view_class(class_id, class_obj):
+    # Students to add are found through the search API, not listed here
+    return render_template('class_detail.html', class_obj=class_obj)
 
-@app.route('/teacher/class/<int:class_id>/add_student', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/add_student', methods=['POST'])
 @teacher_required
-def add_student_to_class(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
-    student_id = request.form.get('student_id')
-    if not student_id:
+@class_owner_required()
+def add_student_to_class(class_id, class_obj):
+    """Enroll every picked student and every pasted roll number in one request"""
+    student_ids = {int(student_id) for student_id in request.form.getlist('student_id') if student_id.isdigit()}
+    roll_numbers = list(dict.fromkeys(request.form.get('roll_numbers', '').replace(',', ' ').split()))
+    if not student_ids and not roll_numbers:
         flash('Please select a student!', 'danger')
-        return redirect(url_for('view_class', class_id=class_id))
+        return redirect(url_for('main.view_class', class_id=class_id))
+    
+    found = set()
+    for chunk in _chunks(roll_numbers):
+        for student_id, roll_number in db.session.query(Student.id, Student.roll_number) \
+                .filter(Student.roll_number.in_(chunk)):
+            student_ids.add(student_id)
+            found.add(roll_number)
+    for chunk in _chunks(student_ids):
+        existing = {student_id for (student_id,) in db.session.query(Student.id).filter(Student.id.in_(chunk))}
+        student_ids.difference_update(set(chunk) - existing)
+    unknown = [roll_number for roll_number in roll_numbers if roll_number not in found]
     
-    student = Student.query.get_or_404(student_id)
-    
-    if student in class_obj.students:
-        flash('Student already enrolled in this class!', 'info')
-    else:
-        try:
-            class_obj.students.append(student)
-            db.session.commit()
-            flash(f'{student.user.username} added to class successfully!', 'success')
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error: {str(e)}', 'danger')
+    try:
+        added = enroll_students(class_id, sorted(student_ids))
+        db.session.commit()
+        if added:
+            flash(f'{added} student(s) added to class successfully!', 'success')
+        if len(student_ids) > added:
+            flash(f'{len(student_ids) - added} student(s) were already enrolled in this class.', 'info')
+        if unknown:
+            shown = ', '.join(unknown[:10]) + (' ...' if len(unknown) > 10 else '')
+            flash(f'No student has roll number(s): {shown}', 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('view_class', class_id=class_id))
+    return redirect(url_for('main.view_class', class_id=class_id))
 
-@app.route('/teacher/class/<int:class_id>/remove_student/<int:student_id>', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/remove_student/<int:student_id>', methods=['POST'])
 @teacher_required
-def remove_student_from_class(class_id, student_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required()
+def remove_student_from_class(class_id, student_id, class_obj):
     student = Student.query.get_or_404(student_id)
     
     if student not in class_obj.students:
@@ -577,36 +2233,30 @@ def remove_student_from_class(class_id, student_id):
             db.session.rollback()
             flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('view_class', class_id=class_id))
+    return redirect(url_for('main.view_class', class_id=class_id))
 
-@app.route('/teacher/class/<int:class_id>/marks')
+@bp.route('/teacher/class/<int:class_id>/marks')
 @teacher_required
-def manage_marks(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
-    return render_template('manage_marks.html', class_obj=class_obj)
+@class_owner_required(*CLASS_ROSTER)
+def manage_marks(class_id, class_obj):
+    filters = {
+        'exam_type': request.args.get('exam_type') or None,
+        'date_from': _date_arg('date_from'),
+        'date_to': _date_arg('date_to')
+    }
+    marks, next_cursor = paginate_class_marks(
+        class_id, cursor=decode_mark_cursor(request.args.get('cursor')), per_page=_page_size(), **filters
+    )
+    total_marks = _filtered_class_marks(class_id, **filters).order_by(None).count()
+    
+    return render_template('manage_marks.html', class_obj=class_obj, marks=graded_marks(marks), total_marks=total_marks,
+                           grade_tones=class_grade_scale(class_id).tones, filters=filters,
+                           next_cursor=encode_mark_cursor(next_cursor) if next_cursor else None)
 
-@app.route('/teacher/class/<int:class_id>/add_mark', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/add_mark', methods=['POST'])
 @teacher_required
-def add_mark(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required()
+def add_mark(class_id, class_obj):
     student_id = request.form.get('student_id')
     marks = request.form.get('marks')
     max_marks = request.form.get('max_marks', 100)
@@ -616,7 +2266,7 @@ def add_mark(class_id):
     
     if not all([student_id, marks, exam_type]):
         flash('Student, marks, and exam type are required!', 'danger')
-        return redirect(url_for('manage_marks', class_id=class_id))
+        return redirect(url_for('main.manage_marks', class_id=class_id))
     
     try:
         mark = Mark(
@@ -630,186 +2280,225 @@ def add_mark(class_id):
             remarks=remarks
         )
         db.session.add(mark)
+        record_mark(mark)
         db.session.commit()
+        rows_written.inc(source='add_mark')
+        chart_cache.invalidate(f'class-{class_id}')
+        chart_cache.invalidate(f'student-{student_id}')
         flash('Mark added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('manage_marks', class_id=class_id))
+    return redirect(url_for('main.manage_marks', class_id=class_id))
 
-@app.route('/teacher/class/<int:class_id>/attendance')
+@bp.route('/teacher/class/<int:class_id>/import_marks', methods=['POST'])
 @teacher_required
-def manage_attendance(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
+@class_owner_required()
+def import_marks(class_id, class_obj):
+    upload = request.files.get('gradebook')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV or XLSX gradebook to upload!', 'danger')
+        return redirect(url_for('main.manage_marks', class_id=class_id))
+    
+    defaults = {
+        'exam_type': request.form.get('exam_type'),
+        'max_marks': request.form.get('max_marks'),
+        'exam_date': request.form.get('exam_date')
+    }
     
-    class_obj = Class.query.get_or_404(class_id)
+    # Roll numbers of enrolled students, fetched once for the whole file
+    enrolled = dict(
+        db.session.query(Student.roll_number, Student.id)
+        .join(class_students, class_students.c.student_id == Student.id)
+        .filter(class_students.c.class_id == class_id).all()
+    )
     
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    max_reported = current_app.config['IMPORT_MAX_REPORTED_ERRORS']
+    batch, errors, error_count, imported = [], [], 0, 0
+    rollup_deltas = {}
     
+    try:
+        for line, row in iter_gradebook_rows(upload.stream, upload.filename):
+            try:
+                values = parse_mark_row(row, defaults)
+                roll_number = values.pop('roll_number')
+                student_id = enrolled.get(roll_number)
+                if student_id is None:
+                    raise ValueError(f'roll number "{roll_number}" is not enrolled in this class')
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < max_reported:
+                    errors.append(f'Row {line}: {e}')
+                continue
+            if error_count:
+                # The import will be rolled back; keep validating without inserting
+                continue
+            
+            values.update(student_id=student_id, class_id=class_id, subject_id=class_obj.subject_id)
+            batch.append(values)
+            imported += 1
+            
+            deltas = rollup_deltas.setdefault(student_id, {'mark_count': 0, 'mark_sum': 0, 'percentage_sum': 0, 'exam_date': None})
+            deltas['mark_count'] += 1
+            deltas['mark_sum'] += values['marks']
+            deltas['percentage_sum'] += (values['marks'] / values['max_marks']) * 100
+            if values['exam_date'] and (deltas['exam_date'] is None or values['exam_date'] > deltas['exam_date']):
+                deltas['exam_date'] = values['exam_date']
+            
+            if len(batch) >= batch_size:
+                db.session.execute(insert(Mark), batch)
+                batch = []
+        
+        if error_count:
+            db.session.rollback()
+            flash(f'Import cancelled: {error_count} invalid row(s), no marks were saved.', 'danger')
+            for error in errors:
+                flash(error, 'warning')
+            if error_count > len(errors):
+                flash(f'...and {error_count - len(errors)} more.', 'warning')
+            return redirect(url_for('main.manage_marks', class_id=class_id))
+        
+        if batch:
+            db.session.execute(insert(Mark), batch)
+        _bump_rollups(class_id, rollup_deltas)
+        db.session.commit()
+    except GradebookError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('main.manage_marks', class_id=class_id))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('main.manage_marks', class_id=class_id))
+    
+    rows_written.inc(imported, source='import_marks')
+    chart_cache.invalidate(f'class-{class_id}')
+    for student_id in rollup_deltas:
+        chart_cache.invalidate(f'student-{student_id}')
+    
+    if imported:
+        flash(f'{imported} mark(s) imported successfully!', 'success')
+    else:
+        flash('The gradebook did not contain any marks.', 'info')
+    return redirect(url_for('main.manage_marks', class_id=class_id))
+
+@bp.route('/teacher/class/<int:class_id>/attendance')
+@teacher_required
+@class_owner_required(*CLASS_ROSTER)
+def manage_attendance(class_id, class_obj):
     # Get attendance for today
     today = date.today()
     attendance_records = Attendance.query.filter_by(class_id=class_id, date=today).all()
+    today_statuses = {record.student_id: record.status for record in attendance_records}
     
-    return render_template('manage_attendance.html', class_obj=class_obj, attendance_records=attendance_records, today=today)
+    # Optional week grid for entering several days at once
+    week_dates, week_statuses, prev_week, next_week = [], {}, None, None
+    week = request.args.get('week')
+    if week:
+        try:
+            week_start = datetime.strptime(week, '%Y-%m-%d').date()
+        except ValueError:
+            week_start = today
+        week_start -= timedelta(days=week_start.weekday())
+        week_dates = [week_start + timedelta(days=i) for i in range(5)]
+        prev_week, next_week = week_start - timedelta(days=7), week_start + timedelta(days=7)
+        week_statuses = {
+            (student_id, d): status for student_id, d, status in
+            db.session.query(Attendance.student_id, Attendance.date, Attendance.status)
+            .filter(Attendance.class_id == class_id, Attendance.date.between(week_dates[0], week_dates[-1])).all()
+        }
+    
+    recent_attendance = Attendance.query.filter_by(class_id=class_id) \
+        .options(joinedload(Attendance.student).joinedload(Student.user)) \
+        .order_by(Attendance.date.desc(), Attendance.id.desc()).limit(20).all()
+    
+    return render_template('manage_attendance.html', class_obj=class_obj, attendance_records=attendance_records,
+                           today_statuses=today_statuses, today=today, recent_attendance=recent_attendance,
+                           week_dates=week_dates, week_statuses=week_statuses,
+                           prev_week=prev_week, next_week=next_week)
 
-@app.route('/teacher/class/<int:class_id>/mark_attendance', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/mark_attendance', methods=['POST'])
 @teacher_required
-def mark_attendance(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required()
+def mark_attendance(class_id, class_obj):
     attendance_date = request.form.get('date')
-    if not attendance_date:
-        attendance_date = date.today()
-    else:
-        attendance_date = datetime.strptime(attendance_date, '%Y-%m-%d').date()
-    
     try:
-        # Get all attendance statuses from form
-        for student in class_obj.students:
-            status = request.form.get(f'status_{student.id}')
-            if status:
-                # Check if attendance already exists for this date
-                existing = Attendance.query.filter_by(
-                    student_id=student.id,
-                    class_id=class_id,
-                    date=attendance_date
-                ).first()
-                
-                if existing:
-                    existing.status = status
-                else:
-                    attendance = Attendance(
-                        student_id=student.id,
-                        class_id=class_id,
-                        date=attendance_date,
-                        status=status
-                    )
-                    db.session.add(attendance)
+        if not attendance_date:
+            attendance_date = date.today()
+        else:
+            attendance_date = datetime.strptime(attendance_date, '%Y-%m-%d').date()
+        
+        enrolled_ids = {student_id for (student_id,) in
+                        db.session.query(class_students.c.student_id).filter(class_students.c.class_id == class_id)}
         
+        # Fields are status_<student_id> for the selected date, or
+        # status_<student_id>_<YYYY-MM-DD> when submitting a whole week
+        statuses = {}
+        for field, status in request.form.items():
+            if not field.startswith('status_') or status not in ATTENDANCE_COUNTERS:
+                continue
+            parts = field.split('_')
+            student_id = int(parts[1])
+            day = datetime.strptime(parts[2], '%Y-%m-%d').date() if len(parts) > 2 else attendance_date
+            if student_id in enrolled_ids:
+                statuses[(student_id, day)] = status
+        
+        changed = save_attendance(class_id, statuses)
         db.session.commit()
+        rows_written.inc(changed, source='mark_attendance')
         flash('Attendance marked successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('manage_attendance', class_id=class_id))
+    return redirect(url_for('main.manage_attendance', class_id=class_id, week=request.form.get('week') or None))
 
-@app.route('/teacher/class/<int:class_id>/analytics')
+@bp.route('/teacher/class/<int:class_id>/analytics')
 @teacher_required
-def class_analytics(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required(joinedload(Class.subject))
+def class_analytics(class_id, class_obj):
     # Calculate analytics
+    mark_stats = get_mark_stats(class_id=class_id)
+    attendance_stats = get_attendance_stats(class_id=class_id)
+    student_stats = get_class_student_stats(class_id)
     analytics = {
-        'class_average': class_obj.get_class_average(),
-        'attendance_percentage': class_obj.get_class_attendance_percentage(),
-        'total_students': len(class_obj.students),
-        'marks_count': len(class_obj.marks),
-        'attendance_count': len(class_obj.attendance)
+        'class_average': mark_stats['average'],
+        'attendance_percentage': attendance_stats['percentage'],
+        'total_students': len(student_stats),
+        'marks_count': mark_stats['count'],
+        'attendance_count': attendance_stats['total']
     }
     
     # Grade distribution
-    grade_distribution = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}
-    for mark in class_obj.marks:
-        grade_distribution[mark.get_grade()] += 1
+    analytics['grade_distribution'] = get_grade_distribution(class_id=class_id)
     
-    analytics['grade_distribution'] = grade_distribution
+    # Spread, percentiles and per-exam-type breakdown from one pass over the marks
+    statistics = mark_statistics(load_mark_arrays(class_id=class_id))
+    _add_z_scores(student_stats, statistics)
     
-    # Generate visualization
-    if class_obj.marks:
-        plt.style.use('seaborn-v0_8')
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-        
-        # Grade distribution chart
-        colors = ['#228B22', '#32CD32', '#FFD700', '#FF8C00', '#FF6347']
-        ax1.bar(grade_distribution.keys(), grade_distribution.values(), color=colors, alpha=0.8)
-        ax1.set_title('Grade Distribution', fontsize=14, fontweight='bold')
-        ax1.set_xlabel('Grades', fontsize=12)
-        ax1.set_ylabel('Number of Students', fontsize=12)
-        ax1.grid(True, alpha=0.3, axis='y')
-        
-        # Performance by student
-        student_averages = {}
-        for student in class_obj.students:
-            student_marks = [m.get_percentage() for m in class_obj.marks if m.student_id == student.id]
-            if student_marks:
-                student_averages[student.user.username[:10]] = sum(student_marks) / len(student_marks)
-        
-        if student_averages:
-            ax2.barh(list(student_averages.keys()), list(student_averages.values()), color='#2E8B57', alpha=0.8)
-            ax2.set_title('Average Performance by Student', fontsize=14, fontweight='bold')
-            ax2.set_xlabel('Average Percentage', fontsize=12)
-            ax2.set_ylabel('Student', fontsize=12)
-            ax2.grid(True, alpha=0.3, axis='x')
-            ax2.set_xlim(0, 100)
-        
-        plt.tight_layout()
-        
-        img = io.BytesIO()
-        plt.savefig(img, format='png', dpi=300, bbox_inches='tight')
-        img.seek(0)
-        plot_url = base64.b64encode(img.getvalue()).decode('utf8')
-        plt.close()
-    else:
-        plot_url = None
+    chart_url = url_for('main.class_chart', class_id=class_id) if analytics['marks_count'] else None
     
-    return render_template('class_analytics.html', class_obj=class_obj, analytics=analytics, plot_url=plot_url)
+    return render_template('class_analytics.html', class_obj=class_obj, analytics=analytics, student_stats=student_stats,
+                           statistics=statistics, grade_scale=class_grade_scale(class_id), chart_url=chart_url)
 
-@app.route('/teacher/class/<int:class_id>/announcements')
+@bp.route('/teacher/class/<int:class_id>/announcements')
 @teacher_required
-def manage_announcements(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required(joinedload(Class.subject), selectinload(Class.announcements))
+def manage_announcements(class_id, class_obj):
     return render_template('manage_announcements.html', class_obj=class_obj)
 
-@app.route('/teacher/class/<int:class_id>/add_announcement', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/add_announcement', methods=['POST'])
 @teacher_required
-def add_announcement(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required()
+def add_announcement(class_id, class_obj):
     title = request.form.get('title')
     content = request.form.get('content')
     
     if not all([title, content]):
         flash('Title and content are required!', 'danger')
-        return redirect(url_for('manage_announcements', class_id=class_id))
+        return redirect(url_for('main.manage_announcements', class_id=class_id))
     
     try:
         announcement = Announcement(
@@ -818,42 +2507,25 @@ def add_announcement(class_id):
             content=content
         )
         db.session.add(announcement)
+        bump_class_version(class_id)
         db.session.commit()
         flash('Announcement posted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('manage_announcements', class_id=class_id))
+    return redirect(url_for('main.manage_announcements', class_id=class_id))
 
-@app.route('/teacher/class/<int:class_id>/assignments')
+@bp.route('/teacher/class/<int:class_id>/assignments')
 @teacher_required
-def manage_assignments(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required(joinedload(Class.subject), selectinload(Class.assignments))
+def manage_assignments(class_id, class_obj):
     return render_template('manage_assignments.html', class_obj=class_obj)
 
-@app.route('/teacher/class/<int:class_id>/add_assignment', methods=['POST'])
+@bp.route('/teacher/class/<int:class_id>/add_assignment', methods=['POST'])
 @teacher_required
-def add_assignment(class_id):
-    user = db.session.get(User, session['user_id'])
-    teacher = user.teacher_profile
-    
-    class_obj = Class.query.get_or_404(class_id)
-    
-    # Verify teacher owns this class (unless admin)
-    if user.role != 'admin' and class_obj.teacher_id != teacher.id:
-        flash('Access denied!', 'danger')
-        return redirect(url_for('teacher_dashboard'))
-    
+@class_owner_required()
+def add_assignment(class_id, class_obj):
     title = request.form.get('title')
     description = request.form.get('description')
     due_date = request.form.get('due_date')
@@ -861,7 +2533,7 @@ def add_assignment(class_id):
     
     if not title:
         flash('Title is required!', 'danger')
-        return redirect(url_for('manage_assignments', class_id=class_id))
+        return redirect(url_for('main.manage_assignments', class_id=class_id))
     
     try:
         assignment = Assignment(
@@ -872,69 +2544,91 @@ def add_assignment(class_id):
             max_marks=float(max_marks) if max_marks else None
         )
         db.session.add(assignment)
+        bump_class_version(class_id)
         db.session.commit()
         flash('Assignment created successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error: {str(e)}', 'danger')
     
-    return redirect(url_for('manage_assignments', class_id=class_id))
+    return redirect(url_for('main.manage_assignments', class_id=class_id))
 
 # ==================== STUDENT ROUTES ====================
 
-@app.route('/student/dashboard')
+@bp.route('/student/dashboard')
 @login_required
 def student_dashboard():
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     
     if user.role != 'student':
         flash('Access denied! Students only.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+    
+    # One lookup decides between 304, the page cache and a full render
+    versions = student_page_versions(user.id)
+    if versions:
+        return versioned_page(f'dashboard-{user.id}', versions, lambda: _render_student_dashboard(current_student()))
     
-    student = user.student_profile
+    student = current_student()
     
     if not student:
         flash('Student profile not found!', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
+    return _render_student_dashboard(student)
+
+def _render_student_dashboard(student):
     # Get student's classes
-    classes = student.classes
+    classes = Class.query.join(class_students, class_students.c.class_id == Class.id) \
+        .filter(class_students.c.student_id == student.id) \
+        .options(joinedload(Class.subject), joinedload(Class.teacher).joinedload(Teacher.user)) \
+        .order_by(Class.id).all()
     
     # Calculate overall statistics
-    overall_average = student.get_average_marks()
-    overall_attendance = student.get_attendance_percentage()
+    mark_stats = get_mark_stats(student_id=student.id)
     
     stats = {
         'total_classes': len(classes),
-        'overall_average': overall_average,
-        'overall_attendance': overall_attendance,
-        'total_marks': len(student.marks)
+        'overall_average': mark_stats['average'],
+        'overall_attendance': student.get_attendance_percentage(),
+        'total_marks': mark_stats['count']
     }
     
-    return render_template('student_dashboard.html', student=student, classes=classes, stats=stats)
+    return render_template('student_dashboard.html', student=student, classes=classes, stats=stats,
+                           class_counts=get_student_class_counts(student.id))
 
-@app.route('/student/class/<int:class_id>')
+@bp.route('/student/class/<int:class_id>')
 @login_required
 def student_view_class(class_id):
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     
     if user.role != 'student':
         flash('Access denied! Students only.', 'danger')
-        return redirect(url_for('dashboard'))
-    
-    student = user.student_profile
+        return redirect(url_for('main.dashboard'))
+    
+    # One lookup decides between 304, the page cache and a full render;
+    # a missing class or enrollment falls through to the checks below
+    versions = student_page_versions(user.id, class_id)
+    if versions:
+        scale = grade_scales().for_subject(versions[0][1])
+        return versioned_page(f'class-{class_id}-{user.id}', [versions, scale.describe()],
+                              lambda: _render_student_class(class_id))
+    return _render_student_class(class_id)
+
+def _render_student_class(class_id):
+    student = current_student()
     class_obj = Class.query.get_or_404(class_id)
     
     # Verify student is enrolled in this class
     if class_obj not in student.classes:
         flash('You are not enrolled in this class!', 'danger')
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
     
     # Get student's marks for this class
-    marks = Mark.query.filter_by(student_id=student.id, class_id=class_id).order_by(Mark.exam_date.desc()).all()
+    marks = graded_marks(Mark.query.filter_by(student_id=student.id, class_id=class_id).order_by(Mark.exam_date.desc()).all())
     
-    # Get student's attendance for this class
-    attendance = Attendance.query.filter_by(student_id=student.id, class_id=class_id).order_by(Attendance.date.desc()).all()
+    # Get student's attendance for this class: one bitmap row per term
+    attendance_terms = [(term, term.summary(), term.weeks()) for term in get_attendance_terms(student.id, class_id)]
     
     # Get class announcements
     announcements = class_obj.announcements
@@ -950,87 +2644,562 @@ def student_view_class(class_id):
                          student=student, 
                          class_obj=class_obj, 
                          marks=marks, 
-                         attendance=attendance,
+                         grade_tones=class_grade_scale(class_id).tones,
+                         attendance_terms=attendance_terms,
                          announcements=announcements,
                          assignments=assignments,
                          class_average=class_average,
                          class_attendance=class_attendance)
 
-@app.route('/student/analytics')
+@bp.route('/student/analytics')
 @login_required
 def student_analytics():
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     
     if user.role != 'student':
         flash('Access denied! Students only.', 'danger')
-        return redirect(url_for('dashboard'))
-    
-    student = user.student_profile
+        return redirect(url_for('main.dashboard'))
     
-    # Generate analytics visualizations
-    marks = student.marks
+    student = current_student()
     
-    if not marks:
+    if not get_mark_stats(student_id=student.id)['count']:
         flash('No marks data available for analysis.', 'warning')
-        return redirect(url_for('student_dashboard'))
-    
-    # Create performance chart
-    plt.style.use('seaborn-v0_8')
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-    
-    # Marks over time
-    marks_data = [(m.exam_date or m.created_at.date(), m.get_percentage()) for m in marks]
-    marks_data.sort(key=lambda x: x[0])
-    dates, percentages = zip(*marks_data)
-    
-    ax1.plot(range(len(dates)), percentages, marker='o', linewidth=2, markersize=8, color='#2E8B57')
-    ax1.fill_between(range(len(dates)), percentages, alpha=0.3, color='#2E8B57')
-    ax1.set_title('Performance Trend', fontsize=14, fontweight='bold')
-    ax1.set_xlabel('Exam Number', fontsize=12)
-    ax1.set_ylabel('Percentage', fontsize=12)
-    ax1.grid(True, alpha=0.3)
-    ax1.set_ylim(0, 100)
+        return redirect(url_for('main.student_dashboard'))
     
-    avg_percentage = sum(percentages) / len(percentages)
-    ax1.axhline(y=avg_percentage, color='red', linestyle='--', alpha=0.7, label=f'Average: {avg_percentage:.1f}%')
-    ax1.legend()
-    
-    # Grade distribution
-    grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}
-    for mark in marks:
-        grade_counts[mark.get_grade()] += 1
-    
-    colors = ['#228B22', '#32CD32', '#FFD700', '#FF8C00', '#FF6347']
-    ax2.bar(grade_counts.keys(), grade_counts.values(), color=colors, alpha=0.8)
-    ax2.set_title('Grade Distribution', fontsize=14, fontweight='bold')
-    ax2.set_xlabel('Grades', fontsize=12)
-    ax2.set_ylabel('Count', fontsize=12)
-    ax2.grid(True, alpha=0.3, axis='y')
+    marks = Mark.query.filter_by(student_id=student.id) \
+        .options(joinedload(Mark.class_ref), joinedload(Mark.subject)) \
+        .order_by(Mark.exam_date.desc(), Mark.id.desc()).all()
+    return render_template('student_analytics.html', student=student, marks=graded_marks(marks),
+                           grade_tones=grade_scales().tones(), chart_url=url_for('main.student_chart'))
+
+# ==================== CHART ROUTES ====================
+
+def _class_chart_data(class_id):
+    """Grade distribution and per-student average percentages for a class"""
+    student_averages = {row['username'][:10]: row['average_percentage']
+                        for row in get_class_student_stats(class_id) if row['exams']}
+    return get_grade_distribution(class_id=class_id), student_averages
+
+def _student_chart_data(student_id):
+    """Time-ordered (date, percentage) series and grade counts for a student"""
+    marks_data = [(point['date'], point['percentage']) for point in get_percentage_series(student_id)]
+    return marks_data, get_grade_distribution(student_id=student_id)
+
+def _chart_size():
+    """Figure width/height (inches) and DPI from the query string, clamped"""
+    def inches(name, default, low, high):
+        value = request.args.get(name, default, type=float)
+        # max()/min() pass NaN straight through; inf would clamp but NaN can't
+        return min(max(value, low), high) if math.isfinite(value) else default
+    width = inches('width', 15, 4, 20)
+    height = inches('height', 6, 2, 12)
+    dpi = min(max(request.args.get('dpi', current_app.config['CHART_DPI'], type=int), 50), 300)
+    return width, height, dpi
+
+def _chart_response(namespace, data, render, *args):
+    """Serve a cached or freshly rendered chart with ETag revalidation"""
+    width, height, dpi = _chart_size()
+    key = ChartCache.make_key(namespace, {'data': data, 'size': [width, height, dpi]})
     
-    plt.tight_layout()
+    if key in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        def render_chart():
+            with chart_render_seconds.time(chart=namespace.split('-')[0]):
+                return render_in_pool(render, *args, width, height, dpi, workers=current_app.config['CHART_RENDER_WORKERS'])
+        png = chart_cache.get_or_render(key, render_chart)
+        response = current_app.response_class(png, mimetype='image/png')
+    response.set_etag(key)
+    # Charts are per-user; let the browser keep them but revalidate each time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/charts/class/<int:class_id>.png')
+@teacher_required
+@class_owner_required(denied=_deny_forbidden)
+def class_chart(class_id, class_obj):
+    grade_distribution, student_averages = _class_chart_data(class_id)
+    return _chart_response(
+        f'class-{class_id}',
+        {'grades': grade_distribution, 'students': list(student_averages.items())},
+        render_class_chart, grade_distribution, student_averages
+    )
+
+@bp.route('/charts/student.png')
+@login_required
+def student_chart():
+    user = current_user()
+    
+    if user.role != 'student' or not current_student():
+        abort(403)
+    
+    student = current_student()
+    marks_data, grade_counts = _student_chart_data(student.id)
+    if not marks_data:
+        abort(404)
+    
+    return _chart_response(
+        f'student-{student.id}',
+        {'series': marks_data, 'grades': grade_counts},
+        render_student_chart, [percentage for _, percentage in marks_data], grade_counts
+    )
+
+# ==================== EXPORT ROUTES ====================
+
+def _export_filters(*names):
+    """Export filters from the query string, limited to ``names``"""
+    filters = {
+        'academic_year': request.args.get('academic_year') or None,
+        'exam_type': request.args.get('exam_type') or None,
+        'date_from': _date_arg('date_from'),
+        'date_to': _date_arg('date_to'),
+    }
+    return {name: filters[name] for name in names}
+
+def _export_response(fmt, filename, header, statement):
+    """Stream ``statement``'s rows as a CSV or XLSX download"""
+    rows = stream_rows(statement, current_app.config['EXPORT_BATCH_SIZE'])
+    # stream_with_context keeps the request (and its DB session) open
+    # until the last chunk has been sent
+    body = stream_with_context(iter_export(fmt, header, rows, sheet_name=filename))
+    response = current_app.response_class(body, content_type=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename) or "export"}.{fmt}"'
+    return response
+
+@bp.route('/teacher/class/<int:class_id>/gradebook.<any(csv, xlsx):fmt>')
+@teacher_required
+@class_owner_required()
+def export_gradebook(class_id, fmt, class_obj):
+    filters = _export_filters('exam_type', 'date_from', 'date_to')
+    return _export_response(fmt, f'{class_obj.name} gradebook', GRADEBOOK_COLUMNS,
+                            gradebook_export_query(class_id, **filters))
+
+@bp.route('/student/transcript.<any(csv, xlsx):fmt>')
+@login_required
+def export_my_transcript(fmt):
+    user = current_user()
     
-    img = io.BytesIO()
-    plt.savefig(img, format='png', dpi=300, bbox_inches='tight')
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode('utf8')
-    plt.close()
+    if user.role != 'student' or not current_student():
+        flash('Access denied! Students only.', 'danger')
+        return redirect(url_for('main.dashboard'))
     
-    return render_template('student_analytics.html', student=student, plot_url=plot_url)
+    filters = _export_filters('academic_year', 'exam_type', 'date_from', 'date_to')
+    return _export_response(fmt, f'{user.username} transcript', TRANSCRIPT_COLUMNS,
+                            transcript_export_query(current_student().id, **filters))
+
+@bp.route('/admin/student/<int:user_id>/transcript.<any(csv, xlsx):fmt>')
+@admin_required
+def export_student_transcript(user_id, fmt):
+    student = Student.query.options(joinedload(Student.user)).filter_by(user_id=user_id).first_or_404()
+    filters = _export_filters('academic_year', 'exam_type', 'date_from', 'date_to')
+    return _export_response(fmt, f'{student.user.username} transcript', TRANSCRIPT_COLUMNS,
+                            transcript_export_query(student.id, **filters))
+
+@bp.route('/admin/attendance_register.<any(csv, xlsx):fmt>')
+@admin_required
+def export_attendance_register(fmt):
+    filters = _export_filters('academic_year', 'date_from', 'date_to')
+    return _export_response(fmt, 'attendance register', ATTENDANCE_COLUMNS, attendance_register_query(**filters))
+
+# ==================== METRICS ENDPOINT ====================
+
+def _may_read_metrics():
+    # Metrics reveal endpoints and traffic, so they need the bearer token or
+    # an admin session unless METRICS_PUBLIC opts out
+    if current_app.config['METRICS_PUBLIC']:
+        return True
+    token = current_app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    user = current_user()
+    return user is not None and user.role == 'admin'
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    if not _may_read_metrics():
+        abort(401)
+    if not metrics.enabled:
+        abort(404)
+    return current_app.response_class(metrics.render(), mimetype=METRICS_CONTENT_TYPE)
+
+# ==================== ANALYTICS API ====================
+
+@bp.route('/api/class/<int:class_id>/analytics')
+@teacher_required
+@class_owner_required(denied=_deny_json)
+def class_analytics_api(class_id, class_obj):
+    """Data behind the class analytics page, for client-side charts"""
+    mark_stats = get_mark_stats(class_id=class_id)
+    attendance_stats = get_attendance_stats(class_id=class_id)
+    students = get_class_student_stats(class_id)
+    statistics = mark_statistics(load_mark_arrays(class_id=class_id))
+    _add_z_scores(students, statistics)
+    return jsonify({
+        'class': {'id': class_obj.id, 'name': class_obj.name, 'section': class_obj.section},
+        'summary': {
+            'class_average': mark_stats['average'],
+            'attendance_percentage': attendance_stats['percentage'],
+            'total_students': len(students),
+            'marks_count': mark_stats['count'],
+            'attendance_count': attendance_stats['total']
+        },
+        'grade_distribution': get_grade_distribution(class_id=class_id),
+        'statistics': {'overall': statistics['overall'], 'exam_types': statistics['exam_types']},
+        'students': students
+    })
+
+@bp.route('/api/class/<int:class_id>/student/<int:student_id>/attendance')
+@teacher_required
+@class_owner_required(denied=_deny_json)
+def student_attendance_api(class_id, student_id, class_obj):
+    """A student's attendance calendar, counts and streaks in a class, term by term"""
+    return jsonify({'student_id': student_id, 'class_id': class_id, 'terms': [
+        dict(term.summary(), term_start=term.start.isoformat(),
+             days={day.isoformat(): status for day, status in term.days().items()})
+        for term in get_attendance_terms(student_id, class_id)
+    ]})
+
+@bp.route('/api/subject/<int:subject_id>/statistics')
+@teacher_required
+def subject_statistics_api(subject_id):
+    """Mark statistics across a subject's classes: the teacher's own, or all of them for admins"""
+    subject = db.session.get(Subject, subject_id) or abort(404)
+    teacher_id = None
+    if current_user().role != 'admin':
+        teacher = current_teacher()
+        if not teacher or not db.session.query(Class.id).filter_by(subject_id=subject_id, teacher_id=teacher.id).first():
+            return _deny_json()
+        teacher_id = teacher.id
+    statistics = mark_statistics(load_mark_arrays(subject_id=subject_id, teacher_id=teacher_id))
+    return jsonify({
+        'subject': {'id': subject.id, 'name': subject.name, 'code': subject.code},
+        'overall': statistics['overall'],
+        'exam_types': statistics['exam_types'],
+        'students': [dict(student, id=student_id) for student_id, student in statistics['students'].items()]
+    })
+
+@bp.route('/api/student/analytics')
+@login_required
+def student_analytics_api():
+    """Data behind the student analytics page, for client-side charts"""
+    user = current_user()
+    
+    if user.role != 'student' or not current_student():
+        return jsonify({'error': 'Students only'}), 403
+    
+    student = current_student()
+    series = get_percentage_series(student.id)
+    for point in series:
+        point['date'] = point['date'].isoformat()
+    return jsonify({
+        'student': {'id': student.id, 'roll_number': student.roll_number},
+        'average_percentage': get_mark_stats(student_id=student.id)['average_percentage'],
+        'grade_distribution': get_grade_distribution(student_id=student.id),
+        'series': series
+    })
+
+@bp.route('/api/students/search')
+@teacher_required
+def search_students_api():
+    """Typeahead for enrollment: students matching ``q``, minus those in ``class_id``"""
+    class_id = request.args.get('class_id', type=int)
+    if class_id is not None:
+        class_obj = Class.query.options(joinedload(Class.teacher)).filter_by(id=class_id).first_or_404()
+        if not owns_class(class_obj):
+            return _deny_json()
+    max_results = current_app.config['STUDENT_SEARCH_LIMIT']
+    limit = min(max(request.args.get('limit', max_results, type=int), 1), max_results)
+    rows = search_students(request.args.get('q', ''), exclude_class_id=class_id, limit=limit)
+    return jsonify({'students': [{'id': student_id, 'username': username, 'email': email, 'roll_number': roll_number}
+                                 for student_id, username, email, roll_number in rows]})
 
 # ==================== UTILITY ROUTES ====================
 
-@app.route('/api/subjects')
+@bp.route('/api/subjects')
 @login_required
 def get_subjects():
     """API endpoint to get all subjects"""
     subjects = Subject.query.all()
     return jsonify([{'id': s.id, 'name': s.name, 'code': s.code} for s in subjects])
 
+# ==================== CLI COMMANDS ====================
+
+@bp.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Rebuild the student/class rollup from raw marks and attendance"""
+    drift = rebuild_rollup()
+    for (student_id, class_id), problem in drift:
+        click.echo(f'student {student_id}, class {class_id}: {problem}')
+    click.echo(f'Rollup rebuilt, {len(drift)} drifted value(s) corrected.')
+
+@bp.cli.command('rebuild-attendance-bitmaps')
+def rebuild_attendance_bitmaps_command():
+    """Rebuild the per-term attendance bitmaps from the attendance table"""
+    count = rebuild_attendance_bitmaps()
+    db.session.commit()
+    click.echo(f'{count:,} attendance bitmap(s) rebuilt.')
+
+@bp.cli.command('chart-stress')
+@click.option('--threads', default=8, show_default=True, help='Concurrent render threads.')
+@click.option('--iterations', default=4, show_default=True, help='Charts rendered per thread.')
+def chart_stress_command(threads, iterations):
+    """Render charts concurrently and check the output is deterministic"""
+    renders, mismatches = stress_test(threads, iterations)
+    if mismatches:
+        raise click.ClickException(f'{mismatches} of {renders} concurrent renders differed from the serial render.')
+    click.echo(f'{renders} concurrent renders on {threads} threads matched the serial output.')
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations"""
+    db.create_all()
+    ran = migrate_database()
+    for migration in ran:
+        click.echo(f'Applied migration {migration}')
+    click.echo('Database is up to date.' if not ran else f'{len(ran)} migration(s) applied.')
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Verify each hot route query is served by its composite index"""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('EXPLAIN QUERY PLAN checks only run against SQLite.')
+    failures = 0
+    for name, expected_index, plan, ok in explain_query_plans():
+        click.echo(f"[{'ok' if ok else 'FAIL'}] {name} (expects {expected_index})")
+        for line in plan:
+            click.echo(f'       {line}')
+        failures += not ok
+    if failures:
+        raise click.ClickException(f'{failures} query shape(s) are not using their index.')
+
+@bp.cli.command('check-query-counts')
+@click.option('--budget', default=PAGE_QUERY_BUDGET, show_default=True, help='Maximum SQL statements per page.')
+def check_query_counts_command(budget):
+    """Verify the main pages stay within a fixed SQL statement budget"""
+    with current_app.test_request_context():
+        checks = _page_query_checks()
+    if not checks:
+        raise click.ClickException('No users or classes to check; seed the database first.')
+    failures = 0
+    for name, user, url in checks:
+        status, statements = count_page_queries(user, url)
+        ok = status == 200 and statements <= budget
+        click.echo(f"[{'ok' if ok else 'FAIL'}] {name}: {statements} statement(s), HTTP {status} ({url})")
+        failures += not ok
+    if failures:
+        raise click.ClickException(f'{failures} page(s) exceeded {budget} statements or failed to render.')
+
+@bp.cli.command('db-concurrency-check')
+@click.option('--writers', default=16, show_default=True, help='Parallel writer threads.')
+@click.option('--transactions', default=20, show_default=True, help='Transactions per writer.')
+@click.option('--rows', default=200, show_default=True, help='Rows inserted per transaction.')
+@click.option('--readers', default=12, show_default=True, help='Concurrent reader threads.')
+@click.option('--compare', is_flag=True, help='Also run with the old default SQLite settings.')
+def db_concurrency_check_command(writers, transactions, rows, readers, compare):
+    """Run parallel writers against a scratch SQLite file and count lock errors"""
+    runs = [('production profile', True)] + ([('legacy defaults', False)] if compare else [])
+    failed = False
+    for label, profile in runs:
+        result = run_concurrency_check(writers, transactions, rows, readers, profile=profile)
+        click.echo(f"{label}: {result['committed']}/{result['attempted']} transactions committed, "
+                   f"{result['lock_errors']} lock error(s), {result['seconds']:.2f}s")
+        if result['sample_error']:
+            click.echo(f"  e.g. {result['sample_error']}")
+        failed = failed or (profile and result['lock_errors'])
+    if failed:
+        raise click.ClickException('Parallel writers hit lock errors with the production profile.')
+
+@bp.cli.command('metrics-overhead')
+@click.option('--iterations', default=100000, show_default=True, help='Recorded requests in the microbenchmark.')
+@click.option('--requests', 'request_count', default=1000, show_default=True, help='Test-client requests per run.')
+@click.option('--rounds', default=5, show_default=True, help='Alternating runs with metrics off and on.')
+def metrics_overhead_command(iterations, request_count, rounds):
+    """Measure what request metrics cost per request"""
+    click.echo(f'Recording one request: {benchmark_overhead(MetricsRegistry(), iterations):.2f} us')
+    
+    # End to end through the test client, alternating the hooks off and on;
+    # the fastest run of each is reported to filter out scheduling noise
+    client = current_app.test_client()
+    with current_app.test_request_context():
+        login_url = url_for('main.login')
+    timings = {}
+    installed = metrics.enabled
+    if not installed:
+        metrics.init_app(current_app)
+    for enabled in (False, True) * rounds:
+        metrics.enabled = enabled
+        started = time.perf_counter()
+        for _ in range(request_count):
+            client.get(login_url)
+        timings.setdefault(enabled, []).append((time.perf_counter() - started) / request_count * 1e6)
+    metrics.enabled = installed
+    off, on = min(timings[False]), min(timings[True])
+    click.echo(f'GET /login without metrics: {off:.1f} us, with metrics: {on:.1f} us ({on - off:+.1f} us)')
+
+@bp.cli.command('seed')
+@click.option('--students', default=1000, show_default=True)
+@click.option('--teachers', default=40, show_default=True)
+@click.option('--classes', default=60, show_default=True)
+@click.option('--classes-per-student', default=4, show_default=True)
+@click.option('--marks-per-enrollment', default=8, show_default=True)
+@click.option('--attendance-days', default=40, show_default=True, help='School days of attendance per enrollment.')
+@click.option('--seed', default=42, show_default=True, help='Random seed; the same seed gives the same school.')
+@click.option('--reset', is_flag=True, help='Drop all existing data first.')
+def seed_command(students, teachers, classes, classes_per_student, marks_per_enrollment, attendance_days, seed, reset):
+    """Fill the database with a synthetic school for benchmarking"""
+    if reset:
+        db.drop_all()
+    create_tables()
+    if Student.query.first() or Teacher.query.first() or Subject.query.first() or Class.query.first():
+        raise click.ClickException('The database already has school data; pass --reset to replace it.')
+    if teachers < 1 or classes < 1:
+        raise click.ClickException('At least one teacher and one class are required.')
+    started = time.perf_counter()
+    counts = seed_school(students, teachers, classes, classes_per_student, marks_per_enrollment, attendance_days, seed)
+    for table, count in counts.items():
+        click.echo(f'{table:>20}: {count:,}')
+    click.echo(f'Seeded in {time.perf_counter() - started:.1f}s. Every seeded user\'s password is "{SEED_PASSWORD}".')
+
+@bp.cli.command('benchmark', with_appcontext=False)
+@click.option('--iterations', default=20, show_default=True, help='Timed requests per route.')
+@click.option('--baseline', 'baseline_path', default=None,
+              show_default='instance/benchmark_baseline.json', help='Baseline JSON file.')
+@click.option('--update-baseline', is_flag=True, help='Write these results as the new baseline.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed relative slowdown before failing.')
+@pass_script_info
+def benchmark_command(script_info, iterations, baseline_path, update_baseline, tolerance):
+    """Benchmark every route and compare against the saved baseline"""
+    app = script_info.load_app()
+    baseline_path = baseline_path or os.path.join(app.instance_path, 'benchmark_baseline.json')
+    # Requests run outside a shared app context so each one gets a fresh
+    # session, as it would in production
+    with app.app_context():
+        cases = _benchmark_cases()
+        dataset = benchmark_dataset()
+        engine = db.engine
+    if not cases:
+        raise click.ClickException('Nothing to benchmark; run "flask seed" first.')
+    click.echo('Dataset: ' + ', '.join(f'{count:,} {table}' for table, count in dataset.items()))
+    click.echo(f"{'route':<28}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>10}")
+    
+    def report(name, result):
+        click.echo(f"{name:<28}{result['status']:>7}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                   f"{result['queries']:>9}{result['peak_kib']:>10.0f}")
+    try:
+        results = run_benchmarks(cases, engine, iterations, progress=report)
+    finally:
+        with app.app_context():
+            remove_benchmark_writes(cases)
+    
+    baseline = load_baseline(baseline_path)
+    if update_baseline or baseline is None:
+        write_baseline(baseline_path, results, dataset)
+        click.echo(f'Baseline written to {baseline_path}')
+        return
+    if baseline.get('dataset') != dataset:
+        click.echo('Warning: the baseline was recorded against a different dataset.')
+    regressions = compare_to_baseline(results, baseline, tolerance)
+    for regression in regressions:
+        click.echo(f'REGRESSION {regression}')
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} regression(s) against {baseline_path}')
+    click.echo('No regressions against the baseline.')
+
+# Each snippet runs in a fresh interpreter from the app directory
+STARTUP_SCENARIOS = [
+    ('import app', 'import app'),
+    ('create_app()', 'import app; app.create_app()'),
+    ('create_app() + first chart', 'import app; app.create_app(); '
+                                   'app.render_class_chart({"A": 1}, {"student": 50.0}, dpi=50)'),
+    ('eager plotting (old layout)', 'import matplotlib.pyplot, seaborn; import app; app.create_app()'),
+]
+
+@bp.cli.command('startup-benchmark', with_appcontext=False)
+@click.option('--runs', default=5, show_default=True, help='Fresh processes started per scenario.')
+def startup_benchmark_command(runs):
+    """Measure the import time and memory of starting the app in a new process"""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    click.echo(f"{'scenario':<30}{'ms':>9}{'RSS MiB':>10}{'modules':>9}  plotting")
+    for name, code in STARTUP_SCENARIOS:
+        result = measure_startup(code, app_dir, runs)
+        if result is None:
+            click.echo(f'{name:<30}  skipped (the snippet failed; an optional package may be missing)')
+            continue
+        click.echo(f"{name:<30}{result['ms']:>9.0f}{result['rss_mib']:>10.1f}{result['modules']:>9}  "
+                   f"{'loaded' if result['plotting'] else 'not loaded'}")
+
+@bp.cli.command('stats-benchmark')
+@click.option('--marks', 'mark_count', default=1000000, show_default=True, help='Synthetic marks to summarize.')
+@click.option('--students', default=25000, show_default=True, help='Distinct students among the synthetic marks.')
+@click.option('--repeat', default=3, show_default=True, help='Runs per engine; the fastest is reported.')
+def stats_benchmark_command(mark_count, students, repeat):
+    """Compare the NumPy statistics engine with plain Python loops"""
+    click.echo(f'Generating {mark_count} marks for {students} students...')
+    result = benchmark_statistics(synthetic_marks(mark_count, students), repeat)
+    click.echo(f"Rows to arrays: {result['arrays_ms']:.0f} ms, NumPy statistics: {result['numpy_ms']:.0f} ms, "
+               f"Python loops: {result['loop_ms']:.0f} ms "
+               f"({result['loop_ms'] / max(result['arrays_ms'] + result['numpy_ms'], 0.001):.1f}x)")
+
+    # The same path as the subject statistics API, on the busiest subject
+    busiest = db.session.query(Class.subject_id, func.count(Mark.id)).join(Mark, Mark.class_id == Class.id) \
+        .group_by(Class.subject_id).order_by(func.count(Mark.id).desc()).first()
+    if busiest:
+        started = time.perf_counter()
+        marks = load_mark_arrays(subject_id=busiest[0])
+        loaded = time.perf_counter()
+        mark_statistics(marks)
+        click.echo(f'Subject {busiest[0]} ({len(marks)} marks): query {(loaded - started) * 1000:.0f} ms, '
+                   f'statistics {(time.perf_counter() - loaded) * 1000:.0f} ms')
+    if result['mismatches']:
+        for mismatch in result['mismatches'][:10]:
+            click.echo(f'  {mismatch}')
+        raise click.ClickException(f"{len(result['mismatches'])} value(s) differ between the two engines.")
+
+@bp.cli.command('load-test')
+@click.option('--duration', default=30, show_default=True, help='Seconds of traffic.')
+@click.option('--teachers', default=10, show_default=True, help='Teachers submitting attendance.')
+@click.option('--students', default=50, show_default=True, help='Students polling their dashboards.')
+@click.option('--admins', default=1, show_default=True, help='Admins browsing the admin dashboard.')
+@click.option('--think', default=1.0, show_default=True, help='Mean seconds a user waits between requests.')
+@click.option('--ramp-up', default=5.0, show_default=True, help='Seconds over which students and admins log in.')
+@click.option('--workers', default=4, show_default=True, help='Server worker processes.')
+@click.option('--port', default=5055, show_default=True)
+@click.option('--password', default=SEED_PASSWORD, show_default=True, help='Password of the teacher and student accounts.')
+@click.option('--admin-password', default='admin123', show_default=True)
+def load_test_command(duration, teachers, students, admins, think, ramp_up, workers, port, password, admin_password):
+    """Serve the app locally and replay a realistic traffic mix against it"""
+    plans = load_test_plans(teachers, students, admins, password, admin_password)
+    if not plans:
+        raise click.ClickException('No users to simulate; run "flask seed" first.')
+    roles = {}
+    for role, _ in plans:
+        roles[role] = roles.get(role, 0) + 1
+    click.echo('Virtual users: ' + ', '.join(f'{count} {role}(s)' for role, count in roles.items()))
+    db.session.remove()
+    
+    server = LocalServer(os.path.dirname(os.path.abspath(__file__)), port=port, workers=workers,
+                         env={'DATABASE_URL': current_app.config['SQLALCHEMY_DATABASE_URI']})
+    click.echo(f"Serving with {server.command[2] if 'gunicorn' in server.command else 'werkzeug'} "
+               f"({workers} workers) at {server.base_url} for {duration}s...")
+    with server:
+        report = run_load(server.base_url, plans, duration, think, ramp_up)
+    
+    click.echo(f"{'request':<20}{'count':>8}{'errors':>8}{'locked':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report['routes'].items():
+        click.echo(f"{name:<20}{row['requests']:>8}{row['errors']:>8}{row['lock_errors']:>8}"
+                   f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    error_rate = report['errors'] / report['requests'] * 100 if report['requests'] else 0.0
+    click.echo(f"{report['requests']} requests in {report['seconds']:.1f}s: {report['throughput']:.1f} req/s, "
+               f"{error_rate:.2f}% errors, {report['lock_errors']} 'database is locked' responses, "
+               f"{count_lock_errors(server.output())} lock error(s) in the server log")
+
 # Add today variable to all templates
-@app.context_processor
+@bp.app_context_processor
 def inject_today():
     return {'today': date.today()}
 
 if __name__ == '__main__':
-    create_tables()
+    app = create_app()
+    with app.app_context():
+        create_tables()
     app.run(debug=True)
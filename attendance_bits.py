@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+
+STATUSES = ('present', 'late', 'absent')
+
+# Attendance is packed per term: an academic year starting on the first of
+# this month. Changing it re-buckets days, so existing bitmaps would need
+# `flask rebuild-attendance-bitmaps`.
+TERM_START_MONTH = 8
+
+# One bit per day from the term's first day; 366 covers a leap year
+TERM_DAYS = 366
+BITMAP_BYTES = (TERM_DAYS + 7) // 8
+
+def term_start(day):
+    """First day of the term that ``day`` falls in"""
+    return date(day.year if day.month >= TERM_START_MONTH else day.year - 1, TERM_START_MONTH, 1)
+
+# ==================== TERM BITMAPS ====================
+
+class TermAttendance:
+    """One student's attendance in one class over one term, as three bitmaps.
+
+    Bit ``i`` of a status's bitmap is set when the student had that status
+    on day ``i`` of the term. A day has at most one status; a day with none
+    wasn't recorded (weekends, holidays, days before enrollment). The
+    bitmaps are Python ints, so counts are popcounts and whole-term
+    operations are a handful of big-integer ops rather than a loop over
+    days.
+    """
+
+    __slots__ = ('start', 'bits')
+
+    def __init__(self, start, present=0, late=0, absent=0):
+        self.start = start
+        self.bits = {'present': present, 'late': late, 'absent': absent}
+
+    def __repr__(self):
+        return f'TermAttendance({self.start}, {self.counts()})'
+
+    @classmethod
+    def from_bytes(cls, start, present, late, absent):
+        """Load the little-endian bitmaps written by to_bytes()"""
+        return cls(start, *(int.from_bytes(bits or b'', 'little') for bits in (present, late, absent)))
+
+    def to_bytes(self):
+        """``{status: bytes}``, BITMAP_BYTES little-endian bytes per status"""
+        return {status: bits.to_bytes(BITMAP_BYTES, 'little') for status, bits in self.bits.items()}
+
+    def _offset(self, day):
+        offset = (day - self.start).days
+        if not 0 <= offset < TERM_DAYS:
+            raise ValueError(f'{day} is not in the term starting {self.start}.')
+        return offset
+
+    def set(self, day, status):
+        """Record ``status`` for ``day``, replacing whatever was recorded before"""
+        bit = 1 << self._offset(day)
+        for name in STATUSES:
+            self.bits[name] &= ~bit
+        self.bits[status] |= bit
+
+    def status(self, day):
+        """The status recorded for ``day``, or None"""
+        bit = 1 << self._offset(day)
+        return next((name for name, bits in self.bits.items() if bits & bit), None)
+
+    @property
+    def recorded(self):
+        """Bitmap of every day with a status"""
+        return self.bits['present'] | self.bits['late'] | self.bits['absent']
+
+    def counts(self):
+        """Days with each status"""
+        return {status: bits.bit_count() for status, bits in self.bits.items()}
+
+    def streaks(self, status='present'):
+        """``(current, longest)`` runs of consecutive recorded days with ``status``.
+
+        Unrecorded days neither break nor extend a run. The current run is
+        the one that reaches the latest recorded day, so it is 0 when that
+        day had another status.
+        """
+        recorded = self.recorded
+        if not recorded:
+            return 0, 0
+        hits = self.bits[status]
+        end = 1 << recorded.bit_length()
+        # Gaps join the runs around them; popcount of hits then gives each run's length
+        runs = (hits | ~recorded) & (end - 1)
+        current = longest = 0
+        while runs:
+            low = runs & -runs
+            carried = runs + low
+            stop = carried & -carried
+            run = stop - low
+            runs ^= run
+            length = (hits & run).bit_count()
+            longest = max(longest, length)
+            if stop == end:
+                current = length
+        return current, longest
+
+    def summary(self):
+        """Counts, attendance percentage and present streaks, as get_attendance_stats() reports them"""
+        counts = self.counts()
+        total = sum(counts.values())
+        current, longest = self.streaks()
+        return dict(counts, total=total, percentage=counts['present'] / total * 100 if total else 0,
+                    current_streak=current, longest_streak=longest)
+
+    def statuses(self):
+        """The status of each day of the term (None where unrecorded), first day first"""
+        days = [None] * TERM_DAYS
+        for status, bits in self.bits.items():
+            flags = format(bits, f'0{TERM_DAYS}b')[::-1]
+            offset = flags.find('1')
+            while offset != -1:
+                days[offset] = status
+                offset = flags.find('1', offset + 1)
+        return days
+
+    def days(self):
+        """``{date: status}`` for every recorded day"""
+        return {self.start + timedelta(days=offset): status
+                for offset, status in enumerate(self.statuses()) if status}
+
+    def weeks(self):
+        """Monday-first weeks of ``(date, status)`` from the first to the last recorded day, for a calendar heatmap"""
+        recorded = self.recorded
+        if not recorded:
+            return []
+        first, last = (recorded & -recorded).bit_length() - 1, recorded.bit_length() - 1
+        statuses = self.statuses()
+        monday = first - (self.start + timedelta(days=first)).weekday()
+        return [[(self.start + timedelta(days=offset), statuses[offset] if 0 <= offset < TERM_DAYS else None)
+                 for offset in range(week, week + 7)]
+                for week in range(monday, last + 1, 7)]
+
+def build_terms(rows):
+    """Pack ``(date, status)`` rows of one student in one class into ``{term_start: TermAttendance}``"""
+    terms = {}
+    for day, status in rows:
+        start = term_start(day)
+        term = terms.get(start)
+        if term is None:
+            term = terms[start] = TermAttendance(start)
+        term.set(day, status)
+    return terms
@@ -0,0 +1,230 @@
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import event
+
+from stats import PERCENTILES, MarkArrays, mark_statistics
+
+# A route regresses when its latency or peak memory grows by more than the
+# tolerance (and by more than these absolute floors, so sub-millisecond
+# jitter on fast routes doesn't fail the run), or when it runs more SQL.
+MIN_LATENCY_REGRESSION_MS = 2.0
+MIN_MEMORY_REGRESSION_KIB = 64
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def _request(case):
+    return getattr(case['client'], case.get('method', 'get'))(case['url'], data=case.get('data'))
+
+def benchmark_case(case, engine, iterations=20, warmup=2):
+    """Time one route through the test client.
+
+    ``case`` has ``name``, ``client``, ``url`` and optionally ``method`` and
+    ``data``. Latency is measured without tracing; peak memory comes from
+    one extra traced request so tracemalloc doesn't skew the timings.
+    """
+    for _ in range(warmup):
+        _request(case)
+    gc.collect()
+
+    statements = []
+    def count_statement(*args):
+        statements.append(1)
+
+    timings, status = [], None
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            status = _request(case).status_code
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+
+    tracemalloc.start()
+    try:
+        _request(case)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'queries': len(statements) // iterations,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+def run_benchmarks(cases, engine, iterations=20, warmup=2, progress=None):
+    """Benchmark every case and return ``{name: result}``"""
+    results = {}
+    for case in cases:
+        results[case['name']] = benchmark_case(case, engine, iterations, warmup)
+        if progress:
+            progress(case['name'], results[case['name']])
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """Describe every route that got slower, heavier or chattier than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            continue
+        # Gate on the median: with a few dozen samples the p95 mostly
+        # reflects scheduler and GC noise, so it is recorded but not compared
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance) + MIN_LATENCY_REGRESSION_MS:
+            regressions.append(f"{name}: p50 {before['p50_ms']:.1f} ms -> {result['p50_ms']:.1f} ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} SQL statements")
+        if result['peak_kib'] > before['peak_kib'] * (1 + tolerance) + MIN_MEMORY_REGRESSION_KIB:
+            regressions.append(f"{name}: peak memory {before['peak_kib']:.0f} KiB -> {result['peak_kib']:.0f} KiB")
+    return regressions
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_baseline(path, results, dataset):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'dataset': dataset,
+            'routes': results,
+        }, f, indent=2, sort_keys=True)
+
+# ==================== STARTUP ====================
+
+# Run in a fresh interpreter: times the snippet in argv[1] and reports the
+# process's peak RSS (ru_maxrss is KiB on Linux, bytes on macOS)
+_STARTUP_PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+seconds = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': seconds, 'rss_kib': rss / 1024 if sys.platform == 'darwin' else rss,
+                  'modules': len(sys.modules), 'plotting': 'matplotlib' in sys.modules}))
+'''
+
+def measure_startup(code, cwd, runs=5, env=None):
+    """Median wall time and peak RSS of running ``code`` in a new Python process.
+
+    Returns None if the snippet fails, e.g. because an optional package
+    it imports isn't installed.
+    """
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, code], cwd=cwd, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        'ms': round(statistics.median(s['seconds'] for s in samples) * 1000, 1),
+        'rss_mib': round(statistics.median(s['rss_kib'] for s in samples) / 1024, 1),
+        'modules': samples[-1]['modules'],
+        'plotting': samples[-1]['plotting'],
+    }
+
+# ==================== STATISTICS ====================
+
+def synthetic_marks(count, students, exam_types=('quiz', 'assignment', 'midterm', 'final', 'project'), seed=1):
+    """``(student_id, exam_type, percentage)`` rows shaped like a real gradebook"""
+    rng = random.Random(seed)
+    ability = [rng.gauss(68, 12) for _ in range(students)]
+    return [(i % students + 1, exam_types[i % len(exam_types)],
+             min(100.0, max(0.0, rng.gauss(ability[i % students], 9))))
+            for i in range(count)]
+
+def _loop_describe(values, percentiles):
+    ordered = sorted(values)
+    n = len(ordered)
+    mean = sum(ordered) / n
+
+    def rank(p):
+        position = (n - 1) * p / 100
+        low = int(position)
+        high = min(low + 1, n - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    return {
+        'count': n,
+        'mean': mean,
+        'median': rank(50),
+        'std': (sum((v - mean) ** 2 for v in ordered) / n) ** 0.5,
+        'min': ordered[0],
+        'max': ordered[-1],
+        'percentiles': {p: rank(p) for p in percentiles},
+    }
+
+def loop_mark_statistics(rows, percentiles=PERCENTILES):
+    """The same statistics as stats.mark_statistics, computed with Python loops"""
+    values, by_student, by_type = [], {}, {}
+    for student_id, exam_type, percentage in rows:
+        values.append(percentage)
+        totals = by_student.setdefault(student_id, [0, 0.0])
+        totals[0] += 1
+        totals[1] += percentage
+        by_type.setdefault(exam_type or '', []).append(percentage)
+    means = {student_id: total / count for student_id, (count, total) in by_student.items()}
+    average = sum(means.values()) / len(means)
+    spread = (sum((m - average) ** 2 for m in means.values()) / len(means)) ** 0.5
+    return {
+        'overall': _loop_describe(values, percentiles),
+        'exam_types': {label: _loop_describe(group, percentiles) for label, group in by_type.items()},
+        'students': {student_id: {'count': by_student[student_id][0], 'mean': mean,
+                                  'z_score': (mean - average) / spread if spread > 0 else 0.0}
+                     for student_id, mean in means.items()},
+    }
+
+def _differences(expected, actual, path='', tolerance=1e-6):
+    if isinstance(expected, dict):
+        if set(expected) != set(actual):
+            return [f'{path or "result"}: keys differ']
+        return [d for key in expected for d in _differences(expected[key], actual[key], f'{path}.{key}', tolerance)]
+    if expected is None or actual is None:
+        return [] if expected is actual else [f'{path}: {expected} != {actual}']
+    return [] if math.isclose(expected, actual, rel_tol=tolerance, abs_tol=tolerance) else [f'{path}: {expected} != {actual}']
+
+def benchmark_statistics(rows, repeat=3):
+    """Time the NumPy engine against the loop version on the same rows.
+
+    Reports the best of ``repeat`` runs for building the arrays from rows,
+    computing the statistics from arrays, and the pure-Python loops, plus
+    any values on which the two disagree.
+    """
+    timings = {'arrays_ms': [], 'numpy_ms': [], 'loop_ms': []}
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        marks = MarkArrays.from_rows(rows)
+        built = time.perf_counter()
+        vectorized = mark_statistics(marks)
+        timings['numpy_ms'].append((time.perf_counter() - built) * 1000)
+        timings['arrays_ms'].append((built - started) * 1000)
+        started = time.perf_counter()
+        looped = loop_mark_statistics(rows)
+        timings['loop_ms'].append((time.perf_counter() - started) * 1000)
+    result = {name: round(min(values), 1) for name, values in timings.items()}
+    result['mismatches'] = _differences(looped, vectorized)
+    return result
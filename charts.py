@@ -0,0 +1,301 @@
+import atexit
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+GRADE_COLORS = ['#228B22', '#32CD32', '#FFD700', '#FF8C00', '#FF6347']
+
+# seaborn-v0_8 look, applied to each figure instead of the global rcParams
+TEXT_COLOR = '.15'
+AXES_FACECOLOR = '#EAEAF2'
+
+# ==================== RENDERING ====================
+#
+# Charts are drawn on their own Figure/Agg canvas and never touch pyplot,
+# so they can be rendered from many threads at once. matplotlib is imported
+# on the first render: it costs far more startup time and memory than the
+# rest of the app, and most processes (CLI commands, workers that never
+# serve a chart) don't need it.
+
+def preload_plotting():
+    """Import matplotlib now, e.g. in a server's master before it forks workers"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasAgg
+
+def _new_figure(width, height):
+    Figure, FigureCanvasAgg = preload_plotting()
+    fig = Figure(figsize=(width, height), facecolor='white')
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(1, 2)
+    for ax in axes:
+        ax.set_facecolor(AXES_FACECOLOR)
+        ax.set_axisbelow(True)
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        ax.tick_params(colors=TEXT_COLOR, labelsize=10, length=0, pad=7)
+        ax.grid(True, color='white', linestyle='-', linewidth=1.0)
+    return fig, axes
+
+def _label(ax, title, xlabel, ylabel):
+    ax.set_title(title, fontsize=14, fontweight='bold', color=TEXT_COLOR)
+    ax.set_xlabel(xlabel, fontsize=12, color=TEXT_COLOR)
+    ax.set_ylabel(ylabel, fontsize=12, color=TEXT_COLOR)
+
+def _to_png(fig, dpi):
+    fig.tight_layout()
+    img = io.BytesIO()
+    fig.savefig(img, format='png', dpi=dpi, bbox_inches='tight')
+    return img.getvalue()
+
+def _grade_colors(count):
+    # Best grade first; the lowest grade of any scale gets the failing colour
+    if not count:
+        return []
+    return [GRADE_COLORS[min(i, len(GRADE_COLORS) - 2)] for i in range(count - 1)] + GRADE_COLORS[-1:]
+
+def render_class_chart(grade_distribution, student_averages, width=15, height=6, dpi=300):
+    """Render the grade distribution and per-student averages as a PNG"""
+    fig, (ax1, ax2) = _new_figure(width, height)
+
+    # Grade distribution chart
+    ax1.bar(list(grade_distribution.keys()), list(grade_distribution.values()),
+            color=_grade_colors(len(grade_distribution)), alpha=0.8)
+    _label(ax1, 'Grade Distribution', 'Grades', 'Number of Students')
+    ax1.grid(True, alpha=0.3, axis='y')
+
+    # Performance by student
+    if student_averages:
+        ax2.barh(list(student_averages.keys()), list(student_averages.values()), color='#2E8B57', alpha=0.8)
+        _label(ax2, 'Average Performance by Student', 'Average Percentage', 'Student')
+        ax2.grid(True, alpha=0.3, axis='x')
+        ax2.set_xlim(0, 100)
+
+    return _to_png(fig, dpi)
+
+def render_student_chart(percentages, grade_counts, width=15, height=6, dpi=300):
+    """Render a student's performance trend and grade distribution as a PNG"""
+    fig, (ax1, ax2) = _new_figure(width, height)
+
+    # Marks over time
+    exams = range(len(percentages))
+    ax1.plot(exams, percentages, marker='o', linewidth=2, markersize=8, markeredgewidth=0, color='#2E8B57')
+    ax1.fill_between(exams, percentages, alpha=0.3, color='#2E8B57')
+    _label(ax1, 'Performance Trend', 'Exam Number', 'Percentage')
+    ax1.grid(True, alpha=0.3)
+    ax1.set_ylim(0, 100)
+
+    avg_percentage = sum(percentages) / len(percentages)
+    ax1.axhline(y=avg_percentage, color='red', linestyle='--', alpha=0.7, label=f'Average: {avg_percentage:.1f}%')
+    ax1.legend(frameon=False, fontsize=10)
+
+    # Grade distribution
+    ax2.bar(list(grade_counts.keys()), list(grade_counts.values()),
+            color=_grade_colors(len(grade_counts)), alpha=0.8)
+    _label(ax2, 'Grade Distribution', 'Grades', 'Count')
+    ax2.grid(True, alpha=0.3, axis='y')
+
+    return _to_png(fig, dpi)
+
+def stress_test(threads=8, iterations=4, dpi=72):
+    """Render charts from many threads at once and compare against serial renders.
+
+    Returns ``(renders, mismatches)``; any mismatch means shared state leaked
+    between concurrently drawn figures.
+    """
+    jobs = [
+        (render_class_chart, ({'A': 4, 'B': 7, 'C': 5, 'D': 2, 'F': 1},
+                              {f'student{i}': 40 + (i * 7) % 60 for i in range(25)})),
+        (render_student_chart, ([55.0, 62.5, 71.0, 68.0, 80.0, 77.5, 91.0],
+                                {'A': 1, 'B': 2, 'C': 2, 'D': 1, 'F': 1})),
+    ]
+    expected = [render(*args, dpi=dpi) for render, args in jobs]
+
+    def render_job(i):
+        render, args = jobs[i % len(jobs)]
+        return i % len(jobs), render(*args, dpi=dpi)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(render_job, range(threads * iterations)))
+    mismatches = sum(1 for job, png in results if png != expected[job])
+    return len(results), mismatches
+
+# ==================== WORKER POOL ====================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork so workers don't inherit server threads or DB connections
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_pool.shutdown, wait=False)
+        return _pool
+
+def _reset_pool(pool=None, terminate=False):
+    """Shut down ``pool`` (default: the current one) so the next render starts a fresh pool.
+
+    With ``terminate``, its worker processes are killed too: shutdown()
+    alone leaves a hung render running, and every timeout would leak one
+    busy process. Renders still in flight in that pool then fail with
+    BrokenProcessPool and fall back to rendering inline.
+    """
+    global _pool
+    with _pool_lock:
+        pool = pool or _pool
+        if pool is None:
+            return
+        if pool is _pool:
+            _pool = None
+    if terminate:
+        if hasattr(pool, 'terminate_workers'):  # Python 3.14+
+            pool.terminate_workers()
+            return
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=terminate)
+
+def _forget_pool_after_fork():
+    # The parent's pool and its management thread don't exist in a forked
+    # child; start with no pool (and an unheld lock) instead
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+def render_in_pool(render, *args, workers=2, timeout=60):
+    """Run a render function in the chart worker pool and return its PNG.
+
+    With ``workers=0`` the chart is rendered in the calling thread, as it
+    is when the pool breaks or doesn't answer within ``timeout`` seconds.
+    """
+    if not workers:
+        return render(*args)
+    pool = _get_pool(workers)
+    try:
+        future = pool.submit(render, *args)
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time
+        _reset_pool(pool)
+        return render(*args)
+    except FuturesTimeoutError:
+        # A queued render is simply dropped; one that is still running
+        # holds a worker, so kill that pool's processes and start afresh
+        if not future.cancel():
+            _reset_pool(pool, terminate=True)
+        return render(*args)
+
+# ==================== CACHE ====================
+
+class ChartCache:
+    """Two-tier PNG cache keyed by a hash of the chart's input data.
+
+    Recently used charts live in a bounded in-memory LRU; every chart is
+    also written to ``directory`` so it survives restarts and is shared
+    between worker processes. Entries are grouped by namespace (for example
+    ``class-3``) so all charts for a class can be dropped when it changes.
+    """
+
+    def __init__(self, directory=None, max_entries=64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._memory)
+
+    def init_app(self, app):
+        self.directory = app.config.get('CHART_CACHE_DIR', self.directory)
+        self.max_entries = app.config.get('CHART_CACHE_SIZE', self.max_entries)
+
+    @staticmethod
+    def make_key(namespace, data):
+        """Content address for a chart: namespace plus a digest of its inputs"""
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        return f'{namespace}-{hashlib.sha256(payload.encode()).hexdigest()[:32]}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.png')
+
+    def get(self, key):
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                return png
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    png = f.read()
+            except OSError:
+                return None
+            self._remember(key, png)
+            return png
+        return None
+
+    def put(self, key, png):
+        self._remember(key, png)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """Return the cached PNG for ``key``, calling ``render()`` on a miss"""
+        png = self.get(key)
+        if png is not None:
+            self.hits += 1
+            return png
+        self.misses += 1
+        png = render()
+        self.put(key, png)
+        return png
+
+    def invalidate(self, namespace):
+        """Drop every cached chart in a namespace from both tiers"""
+        prefix = f'{namespace}-'
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                del self._memory[key]
+        if self.directory:
+            for path in glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(prefix)}*.png')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            for path in glob.glob(os.path.join(glob.escape(self.directory), '*.png')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+DEFAULT_DATABASE_URL = 'sqlite:///school.db'
+
+# Applied to every new SQLite connection. WAL lets readers and one writer
+# work at the same time; busy_timeout makes writers queue instead of
+# failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024)),  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
+def database_url():
+    """Database URL from DATABASE_URL, defaulting to the bundled SQLite file"""
+    return os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(url):
+    """Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS"""
+    url = make_url(url)
+    if _is_memory_sqlite(url):
+        # In-memory databases use a single static connection
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+    if url.get_backend_name() == 'sqlite':
+        # Let SQLite's busy_timeout do the waiting, not the Python driver
+        options['connect_args'] = {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000}
+    else:
+        options.update(pool_pre_ping=True, pool_recycle=1800)
+    return options
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def configure_engine(engine):
+    """Install the production connection profile on an engine"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', apply_sqlite_pragmas)
+    return engine
+
+# ==================== CONCURRENCY CHECK ====================
+
+def run_concurrency_check(writers=16, transactions=20, rows=200, readers=12, profile=True):
+    """Hammer a scratch SQLite file with parallel writers and readers.
+
+    Each writer commits ``transactions`` transactions of ``rows`` inserts,
+    shaped like an attendance submission, while readers run aggregate
+    queries. With ``profile=False`` the database uses the settings the app
+    shipped with (rollback journal, the driver's 5 second timeout) for
+    comparison. Returns a dict with
+    committed transactions, lock errors and elapsed seconds.
+    """
+    directory = tempfile.mkdtemp(prefix='sqlite-concurrency-')
+    url = f'sqlite:///{os.path.join(directory, "check.db")}'
+    if profile:
+        engine = configure_engine(create_engine(url, **engine_options(url)))
+    else:
+        engine = create_engine(url, pool_size=writers + readers)
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER, '
+                'class_id INTEGER, status TEXT)'
+            ))
+
+        committed = []
+        lock_errors = []
+        stop = threading.Event()
+
+        def write(writer):
+            for _ in range(transactions):
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text('SELECT count(*) FROM attendance WHERE class_id = :c'), {'c': writer})
+                        conn.execute(
+                            text('INSERT INTO attendance (student_id, class_id, status) VALUES (:s, :c, :status)'),
+                            [{'s': i, 'c': writer, 'status': 'present'} for i in range(rows)]
+                        )
+                    committed.append(1)
+                except OperationalError as e:
+                    lock_errors.append(str(e.orig))
+
+        def read():
+            while not stop.is_set():
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(text('SELECT class_id, count(*) FROM attendance GROUP BY class_id')).all()
+                except OperationalError as e:
+                    lock_errors.append(str(e.orig))
+
+        started = time.perf_counter()
+        reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        stop.set()
+        for thread in reader_threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'attempted': writers * transactions,
+        'committed': len(committed),
+        'lock_errors': len(lock_errors),
+        'sample_error': lock_errors[0] if lock_errors else None,
+        'seconds': elapsed,
+    }
@@ -0,0 +1,202 @@
+import csv
+import io
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+# Output is handed to the response in chunks of at least this many bytes
+CHUNK_SIZE = 64 * 1024
+# Rows serialized per write into the compressed worksheet
+XLSX_ROWS_PER_WRITE = 500
+
+MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# ==================== CSV ====================
+
+def iter_csv(header, rows):
+    """Yield a CSV document as UTF-8 byte chunks, reading ``rows`` lazily"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # A byte order mark so Excel opens the file as UTF-8; the gradebook
+    # import reads it back with utf-8-sig
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+# ==================== XLSX ====================
+#
+# A minimal SpreadsheetML package written straight into a zip stream:
+# inline strings instead of a shared-string table, so each row can be
+# compressed and sent as soon as it is read. openpyxl's write-only mode
+# would spool the whole sheet to a temporary file before the first byte.
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '<Relationship Id="rId2" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '</Relationships>'
+)
+# Cell styles: 0 plain, 1 date, 2 bold (the header row)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+_EXCEL_EPOCH = date(1899, 12, 30)
+# Control characters are not allowed in XML 1.0 text
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_INVALID_SHEET_NAME = re.compile(r'[\[\]:*?/\\]')
+
+@lru_cache(maxsize=4096)
+def _text_cell(text, style=0):
+    # Cached because exports repeat the same few strings (class and
+    # subject names, statuses, exam types) on every row
+    style_attr = f' s="{style}"' if style else ''
+    text = escape(_INVALID_XML.sub('', text))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _cell(value, style=0):
+    kind = type(value)
+    if kind is str:
+        return _text_cell(value, style) if value else '<c/>'
+    if value is None:
+        return '<c/>'
+    if kind is float or kind is int:
+        return _number_cell(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return f'<c s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _number_cell(value)
+    return _text_cell(str(value), style)
+
+def _number_cell(value):
+    # Excel rejects <v>inf</v> and <v>nan</v>; such values export as blanks.
+    # repr() of a plain float or int is a valid xsd:double, a NumPy scalar's isn't
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return '<c/>'
+        return f'<c><v>{float(value)!r}</v></c>'
+    return f'<c><v>{int(value)}</v></c>'
+
+def _row(values, style=0):
+    return '<row>' + ''.join(_cell(v, style) for v in values) + '</row>'
+
+class _Sink:
+    """A write-only file that collects what the zip writer produces.
+
+    It has no ``tell()``, so zipfile treats it as unseekable and writes
+    each entry's sizes after its data instead of seeking back.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+def iter_xlsx(header, rows, sheet_name='Sheet1'):
+    """Yield a single-sheet XLSX workbook as byte chunks, reading ``rows`` lazily"""
+    sheet_name = _INVALID_SHEET_NAME.sub(' ', sheet_name).strip()[:31] or 'Sheet1'
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            pending = [_SHEET_START, _row(header, style=2)]
+            for row in rows:
+                pending.append(_row(row))
+                if len(pending) >= XLSX_ROWS_PER_WRITE:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending = []
+                    if sink.size >= CHUNK_SIZE:
+                        yield sink.drain()
+            pending.append(_SHEET_END)
+            sheet.write(''.join(pending).encode('utf-8'))
+    yield sink.drain()
+
+def iter_export(fmt, header, rows, sheet_name='Sheet1'):
+    """Byte chunks of ``rows`` in ``fmt`` ('csv' or 'xlsx')"""
+    if fmt == 'csv':
+        return iter_csv(header, rows)
+    if fmt == 'xlsx':
+        return iter_xlsx(header, rows, sheet_name)
+    raise ValueError(f'Unknown export format "{fmt}"')
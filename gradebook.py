@@ -0,0 +1,131 @@
+import csv
+import io
+import math
+import os
+from datetime import date, datetime
+
+# Header aliases accepted in uploaded gradebooks, mapped to Mark fields
+COLUMN_ALIASES = {
+    'roll_number': 'roll_number', 'roll_no': 'roll_number', 'roll': 'roll_number',
+    'marks': 'marks', 'mark': 'marks', 'score': 'marks',
+    'max_marks': 'max_marks', 'out_of': 'max_marks',
+    'exam_type': 'exam_type', 'exam': 'exam_type',
+    'exam_date': 'exam_date', 'date': 'exam_date',
+    'remarks': 'remarks', 'comments': 'remarks',
+}
+EXAM_TYPES = ('quiz', 'assignment', 'midterm', 'final', 'project')
+
+class GradebookError(ValueError):
+    """The uploaded file as a whole cannot be read as a gradebook"""
+
+def _normalize_header(header):
+    columns = []
+    for name in header:
+        key = str(name or '').strip().lower().replace(' ', '_').replace('.', '')
+        columns.append(COLUMN_ALIASES.get(key))
+    if 'roll_number' not in columns or 'marks' not in columns:
+        raise GradebookError('The first row must name at least the "roll_number" and "marks" columns.')
+    return columns
+
+def _iter_csv(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if header is None:
+        raise GradebookError('The file is empty.')
+    columns = _normalize_header(header)
+    for values in reader:
+        if any(v.strip() for v in values):
+            yield reader.line_num, {c: v for c, v in zip(columns, values) if c}
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise GradebookError('XLSX import requires openpyxl (pip install openpyxl); upload a CSV instead.')
+    try:
+        # read_only mode streams rows instead of building the whole sheet
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise GradebookError(f'Could not open the workbook: {e}')
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise GradebookError('The workbook is empty.')
+        columns = _normalize_header(header)
+        for line, values in enumerate(rows, start=2):
+            if any(v not in (None, '') for v in values):
+                yield line, {c: v for c, v in zip(columns, values) if c}
+    finally:
+        workbook.close()
+
+def iter_gradebook_rows(stream, filename):
+    """Yield ``(line_number, row)`` pairs from an uploaded CSV or XLSX file.
+
+    Rows are read lazily so arbitrarily large files use constant memory.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return _iter_csv(stream)
+    if extension in ('.xlsx', '.xlsm'):
+        return _iter_xlsx(stream)
+    raise GradebookError('Upload a .csv or .xlsx file.')
+
+def _parse_date(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'exam date "{value}" is not in YYYY-MM-DD format')
+
+def _parse_number(value, field):
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise ValueError(f'{field} "{value}" is not a number')
+    # float() accepts "inf", "nan" and overflowing exponents like "1e309"
+    if not math.isfinite(number):
+        raise ValueError(f'{field} "{value}" is not a finite number')
+    return number
+
+def parse_mark_row(row, defaults):
+    """Validate one gradebook row and return Mark column values.
+
+    Missing exam type, max marks or exam date fall back to ``defaults``.
+    Raises ``ValueError`` with a user-facing message for invalid rows.
+    """
+    roll_number = str(row.get('roll_number') or '').strip()
+    if not roll_number:
+        raise ValueError('roll number is missing')
+    if row.get('marks') in (None, ''):
+        raise ValueError('marks are missing')
+    marks = _parse_number(row['marks'], 'marks')
+
+    max_marks = row.get('max_marks')
+    max_marks = _parse_number(max_marks, 'max marks') if max_marks not in (None, '') \
+        else _parse_number(defaults.get('max_marks') or 100, 'max marks')
+    if max_marks <= 0:
+        raise ValueError('max marks must be greater than zero')
+    if not 0 <= marks <= max_marks:
+        raise ValueError(f'marks {marks:g} are outside 0-{max_marks:g}')
+
+    exam_type = str(row.get('exam_type') or defaults.get('exam_type') or '').strip().lower()
+    if exam_type not in EXAM_TYPES:
+        raise ValueError(f'exam type must be one of {", ".join(EXAM_TYPES)}')
+
+    exam_date = row.get('exam_date')
+    exam_date = _parse_date(exam_date if exam_date not in (None, '') else defaults.get('exam_date'))
+
+    return {
+        'roll_number': roll_number,
+        'marks': marks,
+        'max_marks': max_marks,
+        'exam_type': exam_type,
+        'exam_date': exam_date,
+        'remarks': str(row.get('remarks') or '').strip(),
+    }
@@ -0,0 +1,192 @@
+import bisect
+import operator
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import case
+
+# The scale used when a database has none of its own
+DEFAULT_BANDS = (('A', 90), ('B', 80), ('C', 70), ('D', 60), ('F', 0))
+
+# Bootstrap colours for each band, best first; the lowest band is always 'danger'
+BAND_TONES = ('success', 'info', 'warning')
+
+class GradeScaleError(ValueError):
+    """A grade scale definition that can't be used"""
+
+# ==================== SCALES ====================
+
+class GradeScale:
+    """Letter grades and the lowest percentage that earns each one.
+
+    The lowest band catches everything below the band above it, whatever
+    its own cutoff, so every percentage gets exactly one letter.
+    """
+
+    __slots__ = ('letters', 'cutoffs', 'tones', '_ascending', '_letter_array')
+
+    def __init__(self, bands):
+        bands = sorted(bands, key=lambda band: band[1], reverse=True)
+        self.letters = tuple(letter for letter, _ in bands)
+        self.cutoffs = tuple(float(cutoff) for _, cutoff in bands)
+        self.tones = {letter: BAND_TONES[i] if i < min(len(BAND_TONES), len(bands) - 1) else 'danger'
+                      for i, letter in enumerate(self.letters)}
+        # Bucket boundaries for bisect/searchsorted: every cutoff but the lowest, ascending
+        self._ascending = self.cutoffs[-2::-1]
+        self._letter_array = np.array(self.letters[::-1], dtype=object)
+
+    def __eq__(self, other):
+        return isinstance(other, GradeScale) and self.letters == other.letters and self.cutoffs == other.cutoffs
+
+    def __hash__(self):
+        return hash((self.letters, self.cutoffs))
+
+    def __repr__(self):
+        return f'GradeScale({self.describe()!r})'
+
+    @property
+    def bands(self):
+        return list(zip(self.letters, self.cutoffs))
+
+    def describe(self):
+        """The scale in the ``A:90, B:80, ..., F:0`` form that parse_bands() reads"""
+        return ', '.join(f'{letter}:{cutoff:g}' for letter, cutoff in self.bands)
+
+    def grade(self, percentage):
+        """The letter for one percentage"""
+        return self._letter_array[bisect.bisect_right(self._ascending, percentage)]
+
+    def grades(self, percentages):
+        """Letters for an array of percentages, as an object array, in one vectorized lookup"""
+        return self._letter_array[np.searchsorted(self._ascending, percentages, side='right')]
+
+    def sql(self, percentage):
+        """A SQL CASE expression giving the letter for a percentage expression"""
+        return case(*((percentage >= cutoff, letter) for letter, cutoff in self.bands[:-1]),
+                    else_=self.letters[-1])
+
+DEFAULT_SCALE = GradeScale(DEFAULT_BANDS)
+
+def parse_bands(text):
+    """Parse ``A:90, B:80, C:70, D:60, F:0`` into ``[(letter, cutoff), ...]``.
+
+    The cutoff of the lowest band may be left out. Raises GradeScaleError
+    for anything that wouldn't give every percentage a single grade.
+    """
+    bands = []
+    for part in text.replace('\n', ',').split(','):
+        if not part.strip():
+            continue
+        letter, _, cutoff = part.partition(':')
+        letter = letter.strip()
+        if not letter or len(letter) > 5:
+            raise GradeScaleError(f'"{part.strip()}" needs a grade of 1-5 characters.')
+        try:
+            cutoff = float(cutoff) if cutoff.strip() else 0.0
+        except ValueError:
+            raise GradeScaleError(f'"{cutoff.strip()}" is not a percentage (in "{part.strip()}").')
+        if not 0 <= cutoff <= 100:
+            raise GradeScaleError(f'The cutoff for {letter} must be between 0 and 100.')
+        bands.append((letter, cutoff))
+    if len(bands) < 2:
+        raise GradeScaleError('A grade scale needs at least two grades.')
+    if len({letter for letter, _ in bands}) < len(bands):
+        raise GradeScaleError('Each grade can only appear once in a scale.')
+    if len({cutoff for _, cutoff in bands}) < len(bands):
+        raise GradeScaleError('Two grades cannot share the same cutoff.')
+    bands.sort(key=lambda band: band[1], reverse=True)
+    # The lowest grade covers everything down to 0%
+    bands[-1] = (bands[-1][0], 0.0)
+    return bands
+
+# ==================== SCALE SETS ====================
+
+class GradeScales:
+    """The school's default scale plus any per-subject overrides"""
+
+    def __init__(self, default=DEFAULT_SCALE, by_subject=None):
+        self.default = default
+        self.by_subject = {subject_id: scale for subject_id, scale in (by_subject or {}).items() if scale != default}
+
+    def for_subject(self, subject_id):
+        return self.by_subject.get(subject_id, self.default)
+
+    def letters(self, scales=None):
+        """Letters of ``scales`` (default: the default scale), best first and without repeats"""
+        return list(dict.fromkeys(letter for scale in scales or [self.default] for letter in scale.letters))
+
+    def tones(self):
+        """Badge colour of every letter in use; the default scale wins on conflicts"""
+        tones = {}
+        for scale in list(self.by_subject.values()) + [self.default]:
+            tones.update(scale.tones)
+        return tones
+
+    def sql(self, percentage, subject_id):
+        """A CASE expression grading each row with its own subject's scale"""
+        if not self.by_subject:
+            return self.default.sql(percentage)
+        groups = {}
+        for subject, scale in self.by_subject.items():
+            groups.setdefault(scale, []).append(subject)
+        return case(*((subject_id.in_(subjects), scale.sql(percentage)) for scale, subjects in groups.items()),
+                    else_=self.default.sql(percentage))
+
+    def grades(self, percentages, subject_ids=None):
+        """Letters for parallel percentage and subject id arrays"""
+        letters = self.default.grades(percentages)
+        if subject_ids is not None:
+            for subject_id, scale in self.by_subject.items():
+                rows = subject_ids == subject_id
+                if rows.any():
+                    letters[rows] = scale.grades(percentages[rows])
+        return letters
+
+def grade_marks(scales, marks):
+    """``(mark, percentage, grade)`` for each of ``marks``, graded in one vectorized pass.
+
+    ``marks`` are objects with ``marks``, ``max_marks`` and ``subject_id``
+    attributes; a zero or missing maximum counts as 0%.
+    """
+    count = len(marks)
+    if not count:
+        return []
+    scored = np.fromiter(map(operator.attrgetter('marks'), marks), np.float64, count)
+    out_of = np.fromiter((mark.max_marks or 0 for mark in marks), np.float64, count)
+    percentages = np.divide(scored, out_of, out=np.zeros(count), where=out_of != 0) * 100
+    subject_ids = np.fromiter((mark.subject_id or 0 for mark in marks), np.int64, count) if scales.by_subject else None
+    return list(zip(marks, percentages.tolist(), scales.grades(percentages, subject_ids).tolist()))
+
+# ==================== CACHE ====================
+
+class GradeScaleCache:
+    """Grade scales loaded from the database at most once per ``ttl`` seconds.
+
+    Every process keeps its own copy. The process that changes a scale
+    calls invalidate(); the others pick the change up when their copy
+    expires.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._scales = None
+        self._expires = 0.0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('GRADE_SCALE_CACHE_SECONDS', self.ttl)
+
+    def get(self, load):
+        """The cached GradeScales, calling ``load()`` to refresh them when expired"""
+        scales = self._scales
+        if scales is not None and time.monotonic() < self._expires:
+            return scales
+        with self._lock:
+            if self._scales is None or time.monotonic() >= self._expires:
+                self._scales = load()
+                self._expires = time.monotonic() + self.ttl
+            return self._scales
+
+    def invalidate(self):
+        self._scales = None
@@ -0,0 +1,210 @@
+import http.cookiejar
+import importlib.util
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks import percentile
+
+LOCK_ERROR = 'database is locked'
+
+# ==================== SERVER ====================
+
+def server_command(app_dir, host, port, workers):
+    """Command line for a local multi-worker WSGI server.
+
+    gunicorn is used when installed, building the app once in the master
+    and forking the workers from it; otherwise werkzeug's forking server,
+    which handles up to ``workers`` requests in parallel processes.
+    """
+    if importlib.util.find_spec('gunicorn'):
+        return [sys.executable, '-m', 'gunicorn', '--chdir', app_dir, '--workers', str(workers),
+                '--bind', f'{host}:{port}', '--log-level', 'warning', '--preload', 'app:create_app()']
+    code = ('import sys; sys.path.insert(0, sys.argv[1]); from app import create_app; app = create_app(); '
+            'from werkzeug.serving import run_simple; '
+            'run_simple(sys.argv[2], int(sys.argv[3]), app, processes=int(sys.argv[4]), threaded=False)')
+    return [sys.executable, '-c', code, app_dir, host, str(port), str(workers)]
+
+def _wait_for_port(host, port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with code {process.returncode} before accepting connections.')
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'The server did not start listening on {host}:{port} within {timeout}s.')
+
+class LocalServer:
+    """Run the app in a child process for the duration of a ``with`` block"""
+
+    def __init__(self, app_dir, host='127.0.0.1', port=5055, workers=4, env=None):
+        self.command = server_command(app_dir, host, port, workers)
+        self.host, self.port = host, port
+        self.base_url = f'http://{host}:{port}'
+        self.env = env
+        self.log = tempfile.TemporaryFile(mode='w+')
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, stdout=self.log, stderr=subprocess.STDOUT,
+                                        env=dict(os.environ, **(self.env or {})))
+        try:
+            _wait_for_port(self.host, self.port, self.process)
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def output(self):
+        self.log.seek(0)
+        return self.log.read()
+
+# ==================== VIRTUAL USERS ====================
+
+class _Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, name, seconds, ok, locked):
+        with self._lock:
+            self.samples.append((name, seconds, ok, locked))
+
+class _Browser:
+    """A cookie-keeping HTTP client for one virtual user"""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, name, path, data=None, expect=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        ok, locked = False, False
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=60) as response:
+                text = response.read().decode('utf-8', 'replace')
+                locked = LOCK_ERROR in text
+                # Redirects are followed; failed forms come back as error flashes
+                ok = not locked and 'alert-danger' not in text and (expect is None or expect in response.url)
+        except urllib.error.HTTPError as e:
+            locked = LOCK_ERROR in e.read().decode('utf-8', 'replace')
+        except OSError:
+            pass
+        self.recorder.add(name, time.perf_counter() - started, ok, locked)
+        return ok
+
+    def login(self, username, password, landing):
+        return self.request('login', '/login', {'username': username, 'password': password}, expect=landing)
+
+def _think(rng, mean):
+    time.sleep(rng.expovariate(1 / mean) if mean > 0 else 0)
+
+def _teacher(browser, plan, deadline, rng, think):
+    # The 8am roll call: everyone submits attendance as soon as they log in
+    if not browser.login(plan['username'], plan['password'], '/teacher/dashboard'):
+        return
+    day = 0
+    while time.monotonic() < deadline:
+        browser.request('manage_attendance', f"/teacher/class/{plan['class_id']}/attendance")
+        statuses = {f'status_{sid}': rng.choice(('present', 'present', 'present', 'late', 'absent'))
+                    for sid in plan['student_ids']}
+        browser.request('mark_attendance', f"/teacher/class/{plan['class_id']}/mark_attendance",
+                        dict(statuses, date=plan['dates'][day % len(plan['dates'])]))
+        day += 1
+        _think(rng, think * 4)
+
+def _student(browser, plan, deadline, rng, think):
+    if not browser.login(plan['username'], plan['password'], '/student/dashboard'):
+        return
+    while time.monotonic() < deadline:
+        browser.request('student_dashboard', '/student/dashboard')
+        _think(rng, think)
+        browser.request('student_analytics', '/student/analytics')
+        _think(rng, think)
+
+def _admin(browser, plan, deadline, rng, think):
+    if not browser.login(plan['username'], plan['password'], '/admin/dashboard'):
+        return
+    while time.monotonic() < deadline:
+        browser.request('admin_dashboard', '/admin/dashboard')
+        _think(rng, think * 2)
+
+SCENARIOS = {'teacher': _teacher, 'student': _student, 'admin': _admin}
+
+def _delayed(scenario, delay):
+    def run(*args):
+        time.sleep(delay)
+        scenario(*args)
+    return run
+
+def run_load(base_url, plans, duration=30, think=1.0, ramp_up=5.0, seed=1):
+    """Replay a traffic mix against a running server.
+
+    ``plans`` is a list of ``(role, plan)`` pairs, one per virtual user,
+    where ``plan`` holds the login and whatever the role's scenario needs.
+    Teachers all start at once, like the first bell; students and admins
+    arrive spread over ``ramp_up`` seconds. Returns a report dict.
+    """
+    recorder = _Recorder()
+    deadline = time.monotonic() + duration
+    threads = []
+    for i, (role, plan) in enumerate(plans):
+        browser = _Browser(base_url, recorder)
+        rng = random.Random(seed * 100003 + i)
+        delay = 0 if role == 'teacher' else rng.uniform(0, ramp_up)
+        threads.append(threading.Thread(target=_delayed(SCENARIOS[role], delay),
+                                        args=(browser, plan, deadline, rng, think), daemon=True))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder.samples, time.perf_counter() - started)
+
+def summarize(samples, elapsed):
+    by_name = {}
+    for name, seconds, ok, locked in samples:
+        by_name.setdefault(name, []).append((seconds, ok, locked))
+    routes = {}
+    for name, rows in sorted(by_name.items()):
+        latencies = [seconds * 1000 for seconds, _, _ in rows]
+        routes[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, ok, _ in rows if not ok),
+            'lock_errors': sum(1 for _, _, locked in rows if locked),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+        }
+    total = len(samples)
+    return {
+        'seconds': elapsed,
+        'requests': total,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'errors': sum(r['errors'] for r in routes.values()),
+        'lock_errors': sum(r['lock_errors'] for r in routes.values()),
+        'routes': routes,
+    }
+
+def count_lock_errors(server_output):
+    return len(re.findall(LOCK_ERROR, server_output))
@@ -0,0 +1,227 @@
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Request latency buckets in seconds, from a cached page up to a slow import
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ==================== SHARDED METRICS ====================
+#
+# Each thread updates its own shard without taking a lock; a scrape sums
+# the shards. Shards of finished threads are folded into a retired total
+# at scrape time so thread-per-request servers don't accumulate them.
+
+class _ShardedMetric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _merge_into(self, total, values):
+        raise NotImplementedError
+
+    def collect(self):
+        """Merged ``{label_values: value}`` across all threads"""
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._merge_into(self._retired, values)
+            self._shards = live
+            total = {}
+            self._merge_into(total, self._retired)
+            for _, values in live:
+                self._merge_into(total, values)
+        return total
+
+class Counter(_ShardedMetric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self._shard()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def _merge_into(self, total, values):
+        # list() snapshots the dict in one step, so a writer inserting a new
+        # label set concurrently can't break the iteration
+        for key, value in list(values.items()):
+            total[key] = total.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield self.name, key, (), value
+
+class Histogram(_ShardedMetric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = self._shard()
+        key = self._key(labels)
+        slots = values.get(key)
+        if slots is None:
+            # One slot per bucket plus +Inf, then the running sum
+            slots = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        slots[bisect.bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _merge_into(self, total, values):
+        for key, slots in list(values.items()):
+            slots = list(slots)
+            merged = total.get(key)
+            if merged is None:
+                total[key] = slots
+            else:
+                for i, value in enumerate(slots):
+                    merged[i] += value
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for key, slots in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, slots):
+                cumulative += count
+                yield f'{self.name}_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', key, (), slots[-1]
+            yield f'{self.name}_count', key, (), cumulative
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+class CallbackMetric:
+    """A gauge or counter whose value is read from the application at scrape time.
+
+    ``callback`` returns a number, or a dict of ``{label_values: number}``.
+    """
+
+    def __init__(self, name, documentation, callback, kind='gauge', labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield self.name, key, (), v
+        elif value is not None:
+            yield self.name, (), (), value
+
+# ==================== REGISTRY ====================
+
+class MetricsRegistry:
+    """Application metrics in Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self.enabled = False
+        self.requests = self.counter(
+            'http_requests_total', 'HTTP requests by endpoint, method and status code.',
+            ('endpoint', 'method', 'status'))
+        self.latency = self.histogram(
+            'http_request_duration_seconds', 'HTTP request latency by endpoint.', ('endpoint', 'method'))
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind='gauge', labelnames=()):
+        return self.register(CallbackMetric(name, documentation, callback, kind, labelnames))
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        self.enabled = True
+
+    def _start_request(self):
+        if self.enabled:
+            g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            self.observe_request(request.endpoint or 'unmatched', request.method, response.status_code,
+                                 time.perf_counter() - started)
+        return response
+
+    def observe_request(self, endpoint, method, status, seconds):
+        # Endpoint names rather than URLs keep the label set bounded
+        self.requests.inc(endpoint=endpoint, method=method, status=status)
+        self.latency.observe(seconds, endpoint=endpoint, method=method)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, extra, value in metric.samples():
+                lines.append(f'{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+def benchmark_overhead(registry, iterations=100000):
+    """Average cost in microseconds of recording one request's metrics"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        registry.observe_request('benchmark', 'GET', 200, 0.001 * (i % 50))
+    return (time.perf_counter() - started) / iterations * 1e6
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+class PageCache:
+    """Rendered pages in a bounded in-memory LRU, keyed by their data versions.
+
+    A key covers every version counter a page depends on, so a write that
+    changes the page changes its key; stale entries are never served and
+    simply age out. ``max_entries=0`` turns the cache off while keeping the
+    ETags.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('PAGE_CACHE_SIZE', self.max_entries)
+        self.clear()
+
+    @staticmethod
+    def make_key(namespace, data):
+        """ETag-safe key for a page: namespace plus a digest of its versions"""
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        return f'{namespace}-{hashlib.sha256(payload.encode()).hexdigest()[:32]}'
+
+    def get(self, key):
+        with self._lock:
+            html = self._pages.get(key)
+            if html is not None:
+                self._pages.move_to_end(key)
+            return html
+
+    def put(self, key, html):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._pages[key] = html
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """Return the cached page for ``key``, calling ``render()`` on a miss"""
+        html = self.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = render()
+        self.put(key, html)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
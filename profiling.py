@@ -0,0 +1,154 @@
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Literals are replaced so that the same statement with different
+# parameters groups under one fingerprint
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|(?<!:):\w+|\?')
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint(statement):
+    """Normalize a SQL statement so repeated shapes aggregate together"""
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+class _Totals:
+    """Running totals for one endpoint or one statement fingerprint"""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'statements', 'endpoint')
+
+    def __init__(self, endpoint=None):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.statements = 0
+        self.endpoint = endpoint
+
+    def add(self, elapsed_ms, statements=0):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.statements += statements
+
+    def as_dict(self, name):
+        return {
+            'name': name,
+            'count': self.count,
+            'total_ms': self.total_ms,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'max_ms': self.max_ms,
+            'avg_statements': self.statements / self.count if self.count else 0.0,
+            'endpoint': self.endpoint,
+        }
+
+class QueryProfiler:
+    """Opt-in per-request SQL instrumentation.
+
+    Engine events time every statement run during a request. Each response
+    gets a ``Server-Timing`` header with the DB time and statement count,
+    and requests slower than ``SLOW_REQUEST_MS`` are logged with their
+    slowest statements. Totals per endpoint and per SQL fingerprint are
+    kept in memory for the admin profiling page.
+    """
+
+    def __init__(self, slow_request_ms=500, slowest_kept=5, max_fingerprints=500):
+        self.slow_request_ms = slow_request_ms
+        self.slowest_kept = slowest_kept
+        self.max_fingerprints = max_fingerprints
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._fingerprints = {}
+        self._app = None
+
+    def init_app(self, app, engine):
+        self._app = app
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        self.slowest_kept = app.config.get('SQL_PROFILE_SLOWEST', self.slowest_kept)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        self.enabled = True
+
+    # ---- engine events ----
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which is discarded with the
+        # statement even when it raises and the after hook never runs
+        context._profiler_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = context._profiler_started
+        if not has_request_context() or 'sql_profile' not in g:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        profile = g.sql_profile
+        profile['statements'] += 1
+        profile['db_ms'] += elapsed_ms
+        profile['queries'].append((elapsed_ms, statement))
+
+    # ---- request hooks ----
+
+    def _start_request(self):
+        g.sql_profile = {'started': time.perf_counter(), 'statements': 0, 'db_ms': 0.0, 'queries': []}
+
+    def _finish_request(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile['started']) * 1000
+        endpoint = request.endpoint or request.path
+        slowest = sorted(profile['queries'], key=lambda q: q[0], reverse=True)[:self.slowest_kept]
+
+        response.headers.add('Server-Timing', f'db;dur={profile["db_ms"]:.1f};desc="{profile["statements"]} queries"')
+        response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+
+        self._record(endpoint, total_ms, profile)
+        if total_ms >= self.slow_request_ms:
+            self._app.logger.warning(
+                'Slow request %s %s: %.1f ms total, %.1f ms in %d SQL statement(s); slowest: %s',
+                request.method, request.full_path.rstrip('?'), total_ms, profile['db_ms'], profile['statements'],
+                '; '.join(f'{ms:.1f} ms {fingerprint(sql)}' for ms, sql in slowest) or 'none'
+            )
+        return response
+
+    def _record(self, endpoint, total_ms, profile):
+        with self._lock:
+            self._endpoints.setdefault(endpoint, _Totals()).add(total_ms, profile['statements'])
+            for elapsed_ms, statement in profile['queries']:
+                key = fingerprint(statement)
+                totals = self._fingerprints.get(key)
+                if totals is None:
+                    if len(self._fingerprints) >= self.max_fingerprints:
+                        continue
+                    totals = self._fingerprints[key] = _Totals(endpoint)
+                totals.add(elapsed_ms)
+
+    # ---- reporting ----
+
+    def worst_endpoints(self, limit=20):
+        """Endpoints ordered by total time spent serving them"""
+        with self._lock:
+            rows = [totals.as_dict(name) for name, totals in self._endpoints.items()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)[:limit]
+
+    def worst_fingerprints(self, limit=20):
+        """SQL fingerprints ordered by total execution time"""
+        with self._lock:
+            rows = [totals.as_dict(name) for name, totals in self._fingerprints.items()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._fingerprints.clear()